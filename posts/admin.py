@@ -10,7 +10,7 @@ class GroupAdmin(admin.ModelAdmin):
 
 
 class PostAdmin(admin.ModelAdmin):
-    list_display = ("pk", "text", "pub_date", "author")
+    list_display = ("pk", "text", "pub_date", "author", "comment_count")
     search_fields = ("text",)
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
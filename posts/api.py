@@ -0,0 +1,148 @@
+"""
+JSON API лент только для чтения.
+
+?fields=id,text,author сужает и ответ, и SELECT: загружаются лишь нужные
+колонки, автор и сообщество приходят тем же запросом через JOIN.
+Страницы листаются курсором ?after=/?before= без OFFSET и COUNT(*).
+"""
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+
+from . import caching
+from .conditional import conditional_feed
+from .feeds import COMMENT_KEYS
+from .models import Comment, Group, Post, User
+from .pagination import FEED_KEYS, CursorPaginator
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Поле ответа -> (колонки для only(), связь для select_related)
+POST_FIELDS = {
+    'id': ((), None),
+    'text': (('text',), None),
+    'pub_date': ((), None),
+    'comment_count': (('comment_count',), None),
+    'image': (('image',), None),
+    'author': (('author', 'author__username', 'author__first_name',
+                'author__last_name'), 'author'),
+    'group': (('group', 'group__slug', 'group__title'), 'group'),
+}
+COMMENT_FIELDS = {
+    'id': ((), None),
+    'text': (('text',), None),
+    'created': ((), None),
+    'post': (('post',), None),
+    'author': (('author', 'author__username', 'author__first_name',
+                'author__last_name'), 'author'),
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _author(user):
+    return {'username': user.username,
+            'name': f'{user.first_name} {user.last_name}'.strip()}
+
+
+def _group(group):
+    if group is None:
+        return None
+    return {'slug': group.slug, 'title': group.title}
+
+
+def _image(post):
+    return post.image.url if post.image else None
+
+
+SERIALIZERS = {
+    'pub_date': lambda obj: obj.pub_date.isoformat(),
+    'created': lambda obj: obj.created.isoformat(),
+    'image': _image,
+    'author': lambda obj: _author(obj.author),
+    'group': lambda obj: _group(obj.group),
+    'post': lambda obj: obj.post_id,
+}
+
+
+def _fields(request, available):
+    value = request.GET.get('fields')
+    if not value:
+        return list(available)
+    fields = [field for field in value.split(',') if field]
+    unknown = set(fields) - set(available)
+    if unknown:
+        raise BadRequest('Неизвестные поля: ' + ', '.join(sorted(unknown)))
+    return fields
+
+
+def _limit(request):
+    try:
+        limit = int(request.GET.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest('limit должен быть числом')
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _project(queryset, fields, available, keys):
+    """Оставляет в SELECT только колонки запрошенных полей и ключей курсора."""
+    columns = set(keys)
+    related = set()
+    for field in fields:
+        field_columns, relation = available[field]
+        columns.update(field_columns)
+        if relation:
+            related.add(relation)
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*columns)
+
+
+def _serialize(obj, fields):
+    return {field: SERIALIZERS[field](obj) if field in SERIALIZERS
+            else getattr(obj, field) for field in fields}
+
+
+def _page_response(request, queryset, available, keys):
+    try:
+        fields = _fields(request, available)
+        limit = _limit(request)
+    except BadRequest as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    queryset = _project(queryset, fields, available, keys)
+    page = CursorPaginator(queryset, limit, keys).get_page(
+        after=request.GET.get('after'), before=request.GET.get('before'))
+    return JsonResponse(
+        {'results': [_serialize(obj, fields) for obj in page],
+         'next': page.next_cursor(),
+         'previous': page.previous_cursor()},
+        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+@conditional_feed(lambda request: [caching.index_feed()])
+def posts(request):
+    return _page_response(request, Post.objects.all(), POST_FIELDS,
+                          FEED_KEYS)
+
+
+@conditional_feed(lambda request, slug: [caching.group_feed(slug)])
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return _page_response(request, Post.objects.filter(group=group),
+                          POST_FIELDS, FEED_KEYS)
+
+
+@conditional_feed(lambda request, username: [caching.profile_feed(username)])
+def profile_posts(request, username):
+    author = get_object_or_404(User, username=username)
+    return _page_response(request, Post.objects.filter(author=author),
+                          POST_FIELDS, FEED_KEYS)
+
+
+@conditional_feed(lambda request, post_id: [caching.post_page(post_id)])
+def post_comments(request, post_id):
+    post = get_object_or_404(Post.objects.only('id'), pk=post_id)
+    return _page_response(request, Comment.objects.filter(post=post),
+                          COMMENT_FIELDS, COMMENT_KEYS)
@@ -0,0 +1,13 @@
+from django.urls import path
+
+from . import api
+
+urlpatterns = [
+    path("posts/", api.posts, name="api_posts"),
+    path("posts/<int:post_id>/comments/", api.post_comments,
+         name="api_post_comments"),
+    path("group/<slug:slug>/posts/", api.group_posts,
+         name="api_group_posts"),
+    path("users/<str:username>/posts/", api.profile_posts,
+         name="api_profile_posts"),
+]
@@ -0,0 +1,52 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def _get_executor(name, workers):
+    with _lock:
+        if name not in _executors:
+            _executors[name] = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix=name)
+        return _executors[name]
+
+
+def _call(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Background task %s%r failed', func.__name__, args)
+
+
+def _run(func, args):
+    close_old_connections()
+    try:
+        _call(func, args)
+    finally:
+        close_old_connections()
+
+
+def _in_memory_db():
+    # Общую in-memory базу SQLite (тестовый прогон) нельзя безопасно
+    # писать из другого потока: будет «database table is locked»
+    return connection.vendor == 'sqlite' and connection.is_in_memory_db()
+
+
+def submit(name, func, *args, workers=1):
+    """
+    Выполняет func(*args) в пуле потоков name после фиксации текущей
+    транзакции. Функции передаются только идентификаторы: объекты
+    перечитываются в рабочем потоке со своим соединением.
+    """
+    if _in_memory_db():
+        _call(func, args)
+        return
+    transaction.on_commit(
+        lambda: _get_executor(name, workers).submit(_run, func, args))
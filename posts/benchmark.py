@@ -0,0 +1,160 @@
+"""
+Замеры представлений через тестовый клиент: задержка (p50/p95),
+число SQL-запросов и пик памяти Python на запрос.
+
+Сценарий — функция, возвращающая (метод, URL, данные) для очередного
+запроса; объекты для URL выбираются случайно из текущей базы.
+Результаты сохраняются как базовая линия и сравниваются с ней.
+"""
+import json
+import random
+import time
+import tracemalloc
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Follow, Group, Post, User
+
+SAMPLE_SIZE = 200
+
+
+class Fixtures:
+    """Случайные объекты базы, на которые ссылаются сценарии."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        posts = list(Post.objects.order_by('?').values_list(
+            'pk', 'author__username')[:SAMPLE_SIZE])
+        if not posts:
+            raise ValueError('В базе нет постов: сначала generate_data')
+        self.posts = posts
+        self.groups = list(Group.objects.values_list('slug', flat=True)[
+            :SAMPLE_SIZE])
+        # Зрители с подписками, чтобы лента подписок не была пустой
+        readers = Follow.objects.values('user').annotate(
+            follows=Count('id')).order_by('-follows')[:SAMPLE_SIZE]
+        self.readers = list(User.objects.filter(
+            pk__in=[row['user'] for row in readers])) or [
+            User.objects.get(username=posts[0][1])]
+
+    def post(self):
+        return self.rng.choice(self.posts)
+
+    def page(self):
+        # Первые страницы открывают чаще глубоких
+        return {'page': min(int(self.rng.paretovariate(1.5)), 50)}
+
+
+def _post_url(fixtures):
+    pk, username = fixtures.post()
+    return reverse('post', kwargs={'username': username, 'post_id': pk})
+
+
+SCENARIOS = {
+    'index': lambda f: ('get', reverse('index'), f.page()),
+    'group_posts': lambda f: (
+        'get', reverse('group_posts', kwargs={
+            'slug': f.rng.choice(f.groups)}), f.page()),
+    'profile': lambda f: (
+        'get', reverse('profile', kwargs={'username': f.post()[1]}),
+        f.page()),
+    'post_view': lambda f: ('get', _post_url(f), None),
+    'follow_index': lambda f: ('get', reverse('follow_index'), f.page()),
+    'new_post': lambda f: (
+        'post', reverse('new_post'), {'text': 'замер производительности'}),
+    'add_comment': lambda f: (
+        'post', _post_url(f) + 'comment', {'text': 'замер'}),
+}
+
+
+def percentile(values, share):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(1, round(share * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def run(names=None, requests=50, warmup=5, memory_samples=5,
+        cold_cache=False, seed=0):
+    """
+    Прогоняет сценарии и возвращает
+    {сценарий: {'p50_ms', 'p95_ms', 'queries', 'peak_kib', 'errors'}}.
+    """
+    rng = random.Random(seed)
+    fixtures = Fixtures(rng)
+    client = Client(HTTP_HOST='localhost')
+    results = {}
+    for name in names or SCENARIOS:
+        scenario = SCENARIOS[name]
+
+        def prepare():
+            # Вход и очистка кеша не попадают в замер
+            client.force_login(rng.choice(fixtures.readers))
+            if cold_cache:
+                cache.clear()
+            return scenario(fixtures)
+
+        def call(method, url, data):
+            return getattr(client, method)(url, data)
+
+        for _ in range(warmup):
+            call(*prepare())
+        timings, queries, errors = [], [], 0
+        for _ in range(requests):
+            request = prepare()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = call(*request)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+            errors += response.status_code >= 400
+        peaks = []
+        for _ in range(memory_samples):
+            request = prepare()
+            tracemalloc.start()
+            call(*request)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+        results[name] = {
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'queries': round(sum(queries) / len(queries), 1),
+            'peak_kib': round(max(peaks), 1) if peaks else None,
+            'errors': errors,
+        }
+    return results
+
+
+def save_baseline(results, path):
+    with open(path, 'w', encoding='utf-8') as baseline:
+        json.dump(results, baseline, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as baseline:
+        return json.load(baseline)
+
+
+def compare(results, baseline, threshold=0.2):
+    """
+    Строки сравнения с базовой линией и список регрессий: p95 или число
+    запросов выросли больше чем на threshold.
+    """
+    lines, regressions = [], []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            lines.append(f'{name}: нет в базовой линии')
+            continue
+        for metric in ('p95_ms', 'queries'):
+            old, new = before[metric], current[metric]
+            change = (new - old) / old if old else 0
+            lines.append(f'{name} {metric}: {old} -> {new} ({change:+.0%})')
+            if change > threshold:
+                regressions.append(f'{name} {metric}')
+    return lines, regressions
@@ -0,0 +1,242 @@
+"""
+Потоковая загрузка фикстур в формате dumpdata (JSON-массив или JSONL).
+
+В отличие от loaddata файл не читается в память целиком, а объекты
+пишутся пачками (insert_raw) без сигналов. Счётчики, ленты подписок
+и версии кеша пересчитываются один раз в конце загрузки.
+"""
+import gzip
+import json
+from itertools import islice
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management.color import no_style
+from django.db import connection, connections, router, transaction
+
+from . import caching, counters, fts, rendering, timelines
+
+# Порядок записи пачек: внешние ключи ссылаются только на модели выше
+MODELS = ('auth.user', 'posts.group', 'posts.post', 'posts.comment',
+          'posts.follow')
+READ_SIZE = 64 * 1024
+
+
+def insert_raw(model, objects, batch_size=1000, ignore_conflicts=False):
+    """
+    bulk_create без pre_save, как при loaddata: auto_now и auto_now_add
+    не заменяют даты из фикстуры временем загрузки. Пустая дата изменения
+    (поле появилось позже дампа) берётся из даты создания, как в
+    миграции 0014, пустая дата создания — как при save().
+    """
+    using = router.db_for_write(model)
+    fields = model._meta.concrete_fields
+    created = [field for field in fields
+               if getattr(field, 'auto_now_add', False)]
+    updated = [field for field in fields
+               if getattr(field, 'auto_now', False)]
+    for obj in objects:
+        for field in created:
+            if getattr(obj, field.attname) is None:
+                field.pre_save(obj, add=True)
+        for field in updated:
+            if getattr(obj, field.attname) is not None:
+                continue
+            if created:
+                setattr(obj, field.attname,
+                        getattr(obj, created[0].attname))
+            else:
+                field.pre_save(obj, add=True)
+    ops = connections[using].ops
+    batch_size = max(min(batch_size, ops.bulk_batch_size(fields, objects)), 1)
+    queryset = model._base_manager.using(using)
+    for start in range(0, len(objects), batch_size):
+        queryset._insert(objects[start:start + batch_size], fields=fields,
+                         raw=True, ignore_conflicts=ignore_conflicts)
+
+
+def refresh_derived():
+    """
+    Массовая вставка не вызывает сигналы: всё, что они поддерживают,
+    пересчитывается по итоговым таблицам.
+    """
+    counters.recount_comments()
+    counters.reconcile_user_stats()
+    rendering.backfill()
+    if timelines.enabled():
+        timelines.rebuild()
+    caching.bump(caching.GLOBAL)
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def iter_json_array(stream):
+    """Разбирает JSON-массив по одному элементу, читая файл кусками."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started:
+            if not buffer and not eof:
+                chunk = stream.read(READ_SIZE)
+                eof = not chunk
+                buffer += chunk
+                continue
+            if not buffer.startswith('['):
+                raise ValueError('Ожидался JSON-массив')
+            buffer = buffer[1:]
+            started = True
+            continue
+        buffer = buffer.lstrip(', \t\r\n')
+        if buffer.startswith(']'):
+            return
+        try:
+            obj, end = decoder.raw_decode(buffer)
+        except ValueError:
+            if eof:
+                raise
+            chunk = stream.read(READ_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield obj
+        buffer = buffer[end:]
+
+
+def iter_objects(path):
+    """Объекты фикстуры: JSONL построчно, иначе элементы JSON-массива."""
+    with _open(path) as stream:
+        if '.jsonl' in path:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from iter_json_array(stream)
+
+
+class Loader:
+    """
+    Копит объекты по моделям и записывает их пачками batch_size.
+    Каждые chunk_size объектов текущая транзакция фиксируется.
+    """
+
+    def __init__(self, batch_size=1000, chunk_size=50000,
+                 ignore_conflicts=False, drop_indexes=False):
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.ignore_conflicts = ignore_conflicts
+        self.drop_indexes = drop_indexes
+        self.models = [apps.get_model(label) for label in MODELS]
+        self.pending = {model: [] for model in self.models}
+        self.pending_m2m = []
+        self.loaded = {model._meta.label_lower: 0 for model in self.models}
+        self.skipped = 0
+
+    def load(self, paths):
+        # Схема меняется до отключения проверок: schema_editor в SQLite
+        # сам включает внешние ключи обратно при выходе
+        if self.drop_indexes:
+            self._drop_indexes()
+        try:
+            # Дамп не упорядочен по зависимостям (комментарии раньше
+            # постов), поэтому ключи проверяются один раз в конце
+            with connection.constraint_checks_disabled():
+                for path in paths:
+                    self._load_file(path)
+        finally:
+            if self.drop_indexes:
+                self._create_indexes()
+        tables = [model._meta.db_table for model in self.models]
+        connection.check_constraints(table_names=tables)
+        self._reset_sequences()
+        refresh_derived()
+        return self.loaded
+
+    def _load_file(self, path):
+        objects = iter_objects(path)
+        while True:
+            read = 0
+            with transaction.atomic():
+                for data in islice(objects, self.chunk_size):
+                    read += 1
+                    if self._add(data) and self._pending() >= self.batch_size:
+                        self._flush()
+                self._flush()
+            if read < self.chunk_size:
+                return
+
+    def _pending(self):
+        return sum(len(objects) for objects in self.pending.values())
+
+    def _add(self, data):
+        if data.get('model', '').lower() not in self.loaded:
+            self.skipped += 1
+            return False
+        deserialized = next(serializers.deserialize(
+            'python', [data], ignorenonexistent=True))
+        obj = deserialized.object
+        self.pending[type(obj)].append(obj)
+        for name, values in (deserialized.m2m_data or {}).items():
+            if values:
+                self.pending_m2m.append((obj, name, values))
+        return True
+
+    def _flush(self):
+        for model in self.models:
+            objects = self.pending[model]
+            if objects:
+                insert_raw(model, objects, self.batch_size,
+                           self.ignore_conflicts)
+                self.loaded[model._meta.label_lower] += len(objects)
+                self.pending[model] = []
+        self._flush_m2m()
+
+    def _flush_m2m(self):
+        rows = {}
+        for obj, name, values in self.pending_m2m:
+            field = obj._meta.get_field(name)
+            through = field.remote_field.through
+            source = field.m2m_field_name() + '_id'
+            target = field.m2m_reverse_field_name() + '_id'
+            rows.setdefault(through, []).extend(
+                through(**{source: obj.pk, target: value})
+                for value in values)
+        for through, objects in rows.items():
+            through.objects.bulk_create(
+                objects, batch_size=self.batch_size, ignore_conflicts=True)
+        self.pending_m2m = []
+
+    def _indexes(self):
+        return [(model, index) for model in self.models
+                for index in model._meta.indexes]
+
+    def _drop_indexes(self):
+        # Индексы и триггеры FTS дешевле построить один раз после вставки
+        with connection.schema_editor() as editor:
+            for model, index in self._indexes():
+                editor.remove_index(model, index)
+            if fts.supported(connection):
+                for suffix in ('insert', 'delete', 'update'):
+                    editor.execute(
+                        f'DROP TRIGGER IF EXISTS {fts.TABLE}_{suffix}')
+
+    def _create_indexes(self):
+        with connection.schema_editor() as editor:
+            for model, index in self._indexes():
+                editor.add_index(model, index)
+            fts.create_triggers(editor)
+
+    def _reset_sequences(self):
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), self.models)
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
@@ -0,0 +1,169 @@
+import datetime
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from yatube import db_router
+
+from .models import Post
+
+VERSION_KEY = 'feed-version:{}'
+COUNT_KEY = 'feed-count:{}'
+# Версия, общая для всех лент: меняется при правке сообществ,
+# чьи названия выводятся в карточках постов
+GLOBAL = 'all'
+
+
+def _timeout():
+    return getattr(settings, 'FEED_CACHE_TIMEOUT', 60 * 60)
+
+
+def _version_timeout():
+    return getattr(settings, 'FEED_VERSION_TIMEOUT', None)
+
+
+def index_feed():
+    return 'index'
+
+
+def group_feed(slug):
+    return f'group:{slug}'
+
+
+def profile_feed(username):
+    return f'profile:{username}'
+
+
+def post_page(post_id):
+    return f'post:{post_id}'
+
+
+def follow_graph(user_id):
+    return f'follow:{user_id}'
+
+
+def post_count(name):
+    """
+    Версия числа постов ленты name. В отличие от версии самой ленты
+    не меняется от комментариев и правок: только при появлении
+    и удалении постов.
+    """
+    return f'count:{name}'
+
+
+def _new_version():
+    # Время смены в начале версии даёт Last-Modified без запросов к БД
+    return f'{time.time():.6f}-{uuid.uuid4().hex}'
+
+
+def _timestamp(version):
+    try:
+        return float(version.split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+def version_time(version):
+    """Момент смены версии или None для версий без метки времени."""
+    timestamp = _timestamp(version)
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+def _avoid_stale_replica(versions):
+    """
+    Кеши под только что сменённой версией заполняются с основной базы:
+    реплика может ещё отставать, а кеш хранил бы устаревшую страницу
+    до следующей смены версии. Отставание считается не больше
+    DATABASE_REPLICA_PIN_SECONDS, как и для cookie после записи.
+    """
+    lag = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 15)
+    fresh_since = time.time() - lag
+    for version in versions:
+        timestamp = _timestamp(version)
+        if timestamp is not None and timestamp > fresh_since:
+            db_router.read_primary()
+            return
+
+
+def get_versions(*names):
+    """
+    Текущие версии лент. Отсутствующая версия создаётся случайной,
+    поэтому после вытеснения ключа старые фрагменты не воскресают.
+    Свежая версия переключает чтение запроса на основную базу.
+    """
+    keys = {VERSION_KEY.format(name): name for name in names}
+    versions = cache.get_many(list(keys))
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        for key, value in missing.items():
+            cache.add(key, value, _version_timeout())
+        versions.update(cache.get_many(list(missing)))
+    result = [versions.get(key, '') for key in keys]
+    _avoid_stale_replica(result)
+    return result
+
+
+def bump(*names):
+    cache.set_many(
+        {VERSION_KEY.format(name): _new_version() for name in set(names)},
+        _version_timeout())
+
+
+def bump_on_commit(*names):
+    """
+    bump после фиксации текущей транзакции. Иначе читатель между bump
+    и COMMIT ещё не видит новых строк и сохраняет старые ленты, числа
+    и ETag под новой версией. Вне транзакции версии меняются сразу.
+    """
+    transaction.on_commit(lambda: bump(*names))
+
+
+def cached_count(queryset, names):
+    """
+    queryset.count() из кеша. Ключ строится из версий names (обычно
+    post_count(...)) и GLOBAL, которую сбрасывает массовая загрузка.
+    """
+    versions = get_versions(GLOBAL, *names)
+    key = COUNT_KEY.format(':'.join(versions))
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, _timeout())
+    return count
+
+
+def feed_cache(request, name):
+    """
+    Контекст для {% cache cache_timeout ... cache_key %} в шаблоне ленты.
+    Ключ учитывает версию ленты, страницу или курсор и зрителя: в карточках
+    есть ссылка «Редактировать», видимая только автору.
+    """
+    versions = get_versions(GLOBAL, name)
+    position = [request.GET.get(param, '')
+                for param in ('page', 'after', 'before')]
+    viewer = request.user.pk if request.user.is_authenticated else ''
+    return {
+        'cache_key': ':'.join(map(str, versions + position + [viewer])),
+        'cache_timeout': _timeout(),
+    }
+
+
+def post_feeds(post_id):
+    """Ленты, в которых показывается карточка поста."""
+    row = Post.objects.filter(pk=post_id).values_list(
+        'author__username', 'group__slug').first()
+    if row is None:
+        return []
+    return feeds_for(*row)
+
+
+def feeds_for(username, group_slug=None):
+    names = [index_feed(), profile_feed(username)]
+    if group_slug:
+        names.append(group_feed(group_slug))
+    return names
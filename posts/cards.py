@@ -0,0 +1,66 @@
+"""
+Кеш HTML карточек постов.
+
+Карточка кешируется целиком, кроме действий зрителя (ссылка
+«Редактировать»): на их месте в кеше стоит MARKER, который заменяется
+при выводе. Ключ включает id поста, updated_at, число комментариев,
+общую версию лент (смена названия сообщества) и вариант текста
+(сокращённый для лент, полный для страницы поста), поэтому устаревшие
+карточки не удаляются явно, а просто перестают запрашиваться.
+Лента собирает все карточки страницы одним cache.get_many.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import caching, thumbnails
+
+KEY = 'post-card:{}:{}:{}:{}:{}'
+MARKER = '<!--viewer-actions-->'
+
+
+def _timeout():
+    return getattr(settings, 'CARD_CACHE_TIMEOUT', 24 * 60 * 60)
+
+
+def card_key(post, version, full_text=False):
+    return KEY.format(post.pk, post.updated_at.timestamp(),
+                      post.comment_count, version,
+                      'full' if full_text else 'preview')
+
+
+def _render(post, full_text=False):
+    return render_to_string('posts/post_item.html', {
+        'post': post, 'viewer_marker': MARKER, 'full_text': full_text})
+
+
+def prefetch(posts, full_text=False):
+    """
+    Находит карточки страницы в кеше одним get_many, недостающие
+    рендерит (с пакетным поиском миниатюр) и кладёт одним set_many.
+    Результат сохраняется в post.card_html.
+    """
+    version, = caching.get_versions(caching.GLOBAL)
+    keys = {post.pk: card_key(post, version, full_text) for post in posts}
+    found = cache.get_many(list(keys.values()))
+    missing = [post for post in posts if keys[post.pk] not in found]
+    if missing:
+        thumbnails.prefetch_card_variants(missing)
+        rendered = {keys[post.pk]: _render(post, full_text)
+                    for post in missing}
+        cache.set_many(rendered, _timeout())
+        found.update(rendered)
+    for post in posts:
+        post.card_html = found[keys[post.pk]]
+
+
+def render_card(post, user, full_text=False):
+    """Карточка из кеша со вставленными действиями текущего зрителя."""
+    if not hasattr(post, 'card_html'):
+        prefetch([post], full_text)
+    actions = ''
+    if user.is_authenticated and user.pk == post.author_id:
+        actions = render_to_string('posts/post_actions.html',
+                                   {'post': post})
+    return mark_safe(post.card_html.replace(MARKER, actions, 1))
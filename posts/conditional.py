@@ -0,0 +1,50 @@
+import hashlib
+
+from django.views.decorators.http import condition
+
+from . import caching
+
+
+def _validators(request, names):
+    """
+    ETag и Last-Modified страницы по версиям её лент: одно чтение кеша,
+    без запросов к постам. Результат запоминается на запросе, потому что
+    condition вызывает функции ETag и Last-Modified по отдельности.
+    """
+    validators = getattr(request, '_feed_validators', None)
+    if validators is not None:
+        return validators
+    versions = caching.get_versions(caching.GLOBAL, *names)
+    viewer = request.user
+    # Страница зависит от зрителя (ссылки «Редактировать», подписка)
+    # и от параметров запроса (страница, курсор). После нового входа
+    # меняется CSRF-токен в форме комментария, поэтому в ETag и last_login
+    login = getattr(viewer, 'last_login', None)
+    parts = versions + [str(viewer.pk or ''), str(login or ''),
+                        request.GET.urlencode()]
+    etag = hashlib.md5(':'.join(parts).encode()).hexdigest()
+    times = [caching.version_time(version) for version in versions]
+    last_modified = None
+    if all(times):
+        last_modified = max(times)
+        # После входа страница меняется, хотя ленты остались прежними
+        if viewer.is_authenticated and viewer.last_login:
+            last_modified = max(last_modified, viewer.last_login)
+    request._feed_validators = (etag, last_modified)
+    return request._feed_validators
+
+
+def conditional_feed(names):
+    """
+    Декоратор условного GET: names(request, *args, **kwargs) возвращает
+    имена лент, из которых собрана страница. Если клиент прислал
+    актуальные If-None-Match или If-Modified-Since, view не вызывается
+    и отдаётся 304.
+    """
+    def etag(request, *args, **kwargs):
+        return _validators(request, names(request, *args, **kwargs))[0]
+
+    def last_modified(request, *args, **kwargs):
+        return _validators(request, names(request, *args, **kwargs))[1]
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
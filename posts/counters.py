@@ -0,0 +1,74 @@
+from django.db import router
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def increment_comment_count(post_id):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F('comment_count') + 1)
+
+
+def decrement_comment_count(post_id):
+    Post.objects.filter(pk=post_id, comment_count__gt=0).update(
+        comment_count=F('comment_count') - 1)
+
+
+def _count(queryset, field, outer='pk'):
+    counts = queryset.filter(**{field: OuterRef(outer)}).order_by().values(
+        field).annotate(total=Count('id')).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+def recount_comments(posts=None):
+    """
+    Пересчитывает comment_count одним UPDATE с подзапросом.
+    Возвращает число обновлённых постов.
+    """
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.update(comment_count=_count(Comment.objects, 'post'))
+
+
+def adjust_user_stats(user_id, **deltas):
+    """
+    Сдвигает счётчики пользователя атомарным UPDATE. Если строки ещё нет,
+    ничего не делает: её соберёт get_user_stats из исходных таблиц.
+    """
+    UserStats.objects.filter(pk=user_id).update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+
+
+def reconcile_user_stats(users=None):
+    """
+    Создаёт недостающие строки UserStats и пересчитывает все счётчики
+    по таблицам постов и подписок. Возвращает число пользователей.
+    """
+    if users is None:
+        users = User.objects.all()
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in users.values_list('pk', flat=True)
+         .iterator()],
+        batch_size=500, ignore_conflicts=True)
+    return UserStats.objects.filter(user__in=users).update(
+        posts_count=_count(Post.objects, 'author', 'user'),
+        followers_count=_count(Follow.objects, 'author', 'user'),
+        following_count=_count(Follow.objects, 'user', 'user'),
+    )
+
+
+def get_user_stats(user):
+    """
+    Счётчики пользователя. Выгоднее загружать пользователя
+    с select_related('stats'), тогда дополнительных запросов нет.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        reconcile_user_stats(User.objects.filter(pk=user.pk))
+        # Строка только что записана: реплика может её ещё не видеть
+        return UserStats.objects.using(
+            router.db_for_write(UserStats)).get(pk=user.pk)
@@ -0,0 +1,61 @@
+"""
+Потоковая выгрузка постов и комментариев пользователя в JSONL или CSV.
+
+Строки читаются из БД курсором порциями CHUNK_SIZE и сразу
+превращаются в текст, поэтому память не растёт с размером аккаунта.
+"""
+import csv
+import json
+
+from .models import Comment, Post
+
+FORMATS = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+CHUNK_SIZE = 2000
+# Общие колонки CSV: у поста нет post_id, у комментария — group и image
+FIELDS = ('type', 'id', 'date', 'text', 'group', 'image', 'comment_count',
+          'post_id')
+
+
+def _posts(user):
+    rows = Post.objects.filter(author=user).order_by('pk').values_list(
+        'id', 'pub_date', 'text', 'group__slug', 'image', 'comment_count')
+    for pk, date, text, group, image, comment_count in rows.iterator(
+            chunk_size=CHUNK_SIZE):
+        yield {'type': 'post', 'id': pk, 'date': date.isoformat(),
+               'text': text, 'group': group, 'image': image or None,
+               'comment_count': comment_count}
+
+
+def _comments(user):
+    rows = Comment.objects.filter(author=user).order_by('pk').values_list(
+        'id', 'created', 'text', 'post_id')
+    for pk, date, text, post_id in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield {'type': 'comment', 'id': pk, 'date': date.isoformat(),
+               'text': text, 'post_id': post_id}
+
+
+def rows(user):
+    yield from _posts(user)
+    yield from _comments(user)
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer: возвращает строку, не храня её."""
+
+    def write(self, value):
+        return value
+
+
+def stream(user, fmt='jsonl'):
+    """Генератор строк выгрузки в формате fmt ('jsonl' или 'csv')."""
+    if fmt == 'csv':
+        writer = csv.DictWriter(_Echo(), fieldnames=FIELDS)
+        yield writer.writerow(dict(zip(FIELDS, FIELDS)))
+        for row in rows(user):
+            yield writer.writerow(row)
+        return
+    for row in rows(user):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
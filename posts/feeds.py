@@ -0,0 +1,62 @@
+from .models import Comment, Post, TimelineEntry
+
+# Поля, которые читает posts/post_item.html. Всё остальное (например,
+# пароль и e-mail автора) в ленту не загружается.
+CARD_FIELDS = (
+    'id', 'preview_html', 'pub_date', 'updated_at', 'image', 'comment_count',
+    'author', 'author__username',
+    'group', 'group__slug', 'group__title',
+)
+
+
+def feed_queryset(queryset=None):
+    """
+    Готовит queryset постов для ленты: автор и сообщество загружаются
+    тем же запросом, поэтому страница из N карточек стоит
+    постоянное число запросов.
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.select_related('author', 'group').only(*CARD_FIELDS)
+
+
+def index_feed():
+    return feed_queryset()
+
+
+def group_feed(group):
+    return feed_queryset(group.post_group.all())
+
+
+def profile_feed(author):
+    return feed_queryset(author.posts.all())
+
+
+def follow_feed(user):
+    return feed_queryset(Post.objects.filter(author__following__user=user))
+
+
+# Ключи курсора для TimelineEntry: pub_date скопирован из поста
+TIMELINE_KEYS = ('pub_date', 'post_id')
+
+
+def timeline_feed(user):
+    """
+    Лента подписок из материализованной таблицы: диапазон по индексу
+    (user, pub_date, post) плюс посты с авторами и сообщества одним JOIN.
+    """
+    return TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group').only(
+        'pub_date', 'post', *(f'post__{field}' for field in CARD_FIELDS))
+
+
+# Ключи курсора комментариев: индекс posts_comment_post_page
+# (post, -created, -id) отдаёт страницу без сортировки
+COMMENT_KEYS = ('created', 'id')
+# Поля, которые читает posts/comment_list.html
+COMMENT_FIELDS = ('id', 'text', 'created', 'author', 'author__username')
+
+
+def comment_feed(post_id):
+    return Comment.objects.filter(post_id=post_id).select_related(
+        'author').only(*COMMENT_FIELDS)
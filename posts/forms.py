@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
+from .images import normalize_upload
 from .models import Post, Comment
 
 
@@ -12,6 +14,13 @@ class PostForm(ModelForm):
             )
         return self.cleaned_data['text']
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Нормализуем только новые загрузки, а не уже сохранённый файл
+        if isinstance(image, UploadedFile):
+            return normalize_upload(image)
+        return image
+
     class Meta:
         model = Post
         fields = ['text', 'group', 'image']
@@ -0,0 +1,69 @@
+"""
+SQL полнотекстового индекса по Post.text (SQLite FTS5).
+
+Таблица хранит только индекс (content='posts_post'), а триггеры держат её
+в синхронизации с постами при любых изменениях, включая bulk-операции
+и админку. SQLite пересоздаёт posts_post при AddField/AlterField и теряет
+триггеры, поэтому такие миграции должны вызывать create_triggers() снова.
+"""
+
+TABLE = 'posts_post_fts'
+
+CREATE_TABLE = f"""
+    CREATE VIRTUAL TABLE {TABLE} USING fts5(
+        text, content='posts_post', content_rowid='id'
+    )
+"""
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER {TABLE}_insert AFTER INSERT ON posts_post BEGIN
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {TABLE}_delete AFTER DELETE ON posts_post BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    f"""
+    CREATE TRIGGER {TABLE}_update AFTER UPDATE OF text ON posts_post BEGIN
+        INSERT INTO {TABLE}({TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {TABLE}(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+REBUILD = f"INSERT INTO {TABLE}({TABLE}) VALUES ('rebuild')"
+
+
+def supported(connection):
+    return connection.vendor == 'sqlite'
+
+
+def create_triggers(schema_editor):
+    if not supported(schema_editor.connection):
+        return
+    for suffix in ('insert', 'delete', 'update'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {TABLE}_{suffix}')
+    for statement in TRIGGERS:
+        schema_editor.execute(statement)
+    # Пока триггеров не было, индекс мог отстать от таблицы
+    schema_editor.execute(REBUILD)
+
+
+def create(schema_editor):
+    if not supported(schema_editor.connection):
+        return
+    schema_editor.execute(CREATE_TABLE)
+    create_triggers(schema_editor)
+
+
+def drop(schema_editor):
+    if not supported(schema_editor.connection):
+        return
+    for suffix in ('insert', 'delete', 'update'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {TABLE}_{suffix}')
+    schema_editor.execute(f'DROP TABLE IF EXISTS {TABLE}')
@@ -0,0 +1,72 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 90, 'optimize': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 90},
+    'GIF': {'optimize': True},
+}
+# Снимки телефонов с блоком MPF Pillow открывает как MPO: это JPEG,
+# у которого хранится только первый кадр
+FORMAT_ALIASES = {'MPO': 'JPEG'}
+# Анимация этих форматов хранится как есть; у остальных многокадровых
+# (TIFF) берётся первый кадр
+ANIMATED_FORMATS = ('GIF', 'PNG', 'WEBP')
+# Прочие форматы пересохраняются без потерь в PNG
+FALLBACK_FORMAT = 'PNG'
+PNG_MODES = ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'I')
+
+
+def _max_size():
+    return getattr(settings, 'POST_IMAGE_MAX_SIZE', 2560)
+
+
+def normalize_upload(upload):
+    """
+    Готовит загруженное изображение к хранению: поворачивает по EXIF,
+    ограничивает сторону POST_IMAGE_MAX_SIZE и сохраняет без метаданных
+    (EXIF с геотегами и превью не попадает ни в оригинал, ни в миниатюры).
+    Анимацию больше POST_IMAGE_MAX_SIZE отклоняет с ValidationError.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    max_size = _max_size()
+    if (getattr(image, 'is_animated', False)
+            and image.format in ANIMATED_FORMATS):
+        # Анимацию не пересохраняем, поэтому большую не принимаем вовсе
+        if max(image.size) > max_size:
+            raise ValidationError(
+                'Изображение больше %(size)s пикселей по стороне: '
+                'уменьшите его или сохраните без анимации',
+                code='image_too_large', params={'size': max_size})
+        upload.seek(0)
+        return upload
+    name = os.path.basename(upload.name)
+    image_format = FORMAT_ALIASES.get(image.format, image.format)
+    if image_format not in SAVE_OPTIONS:
+        image_format = FALLBACK_FORMAT
+        name = os.path.splitext(name)[0] + '.png'
+    image.seek(0)
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    if image_format == 'PNG' and image.mode not in PNG_MODES:
+        image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+    options = dict(SAVE_OPTIONS[image_format])
+    # Из метаданных переносятся только цветовой профиль и прозрачный
+    # цвет палитры (PNG и GIF в режиме P)
+    for key in ('icc_profile', 'transparency'):
+        if image.info.get(key) is not None:
+            options[key] = image.info[key]
+    image.info = {}
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type=Image.MIME[image_format])
@@ -0,0 +1,46 @@
+import glob
+import os
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from yatube import profiling
+
+
+class Command(BaseCommand):
+    help = ('Сводит профили из PROFILING_DIR в один файл свёрнутых стеков '
+            'для flamegraph.pl или speedscope (веса в микросекундах)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--view', help='Только профили представления (имя URL)')
+        parser.add_argument(
+            '--output', help='Файл результата (по умолчанию stdout)')
+
+    def handle(self, *args, view=None, output=None, **options):
+        directory = getattr(settings, 'PROFILING_DIR', 'profiles')
+        pattern = f'*-{view}-*' if view else '*'
+        paths = sorted(glob.glob(os.path.join(directory, pattern)))
+        collapsed = [path for path in paths if path.endswith('.collapsed')]
+        prof = [path for path in paths if path.endswith('.prof')]
+        if not collapsed and not prof:
+            raise CommandError(f'Нет профилей в {directory}')
+        # Сэмплы и pstats сводятся в одних единицах, микросекундах:
+        # сэмпл стоит интервала между снимками
+        interval = getattr(settings, 'PROFILING_INTERVAL_MS', 5) * 1000
+        stacks = Counter({
+            stack: count * interval for stack, count in
+            profiling.read_collapsed(collapsed).items()})
+        if prof:
+            stacks.update(profiling.pstats_to_collapsed(prof))
+        lines = [f'{stack} {count}\n' for stack, count in
+                 sorted(stacks.items())]
+        if output:
+            with open(output, 'w', encoding='utf-8') as result:
+                result.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
+        self.stderr.write(f'Файлов: {len(collapsed) + len(prof)}, '
+                          f'стеков: {len(stacks)}')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from posts.bulkload import Loader
+
+
+class Command(BaseCommand):
+    help = ('Потоково загружает фикстуры dumpdata (JSON, JSONL, .gz) '
+            'для пользователей, сообществ, постов, комментариев и подписок')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', metavar='fixture')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Объектов в одном bulk_create')
+        parser.add_argument(
+            '--chunk-size', type=int, default=50000,
+            help='Объектов в одной транзакции')
+        parser.add_argument(
+            '--ignore-conflicts', action='store_true',
+            help='Пропускать объекты, чей первичный ключ уже занят')
+        parser.add_argument(
+            '--drop-indexes', action='store_true',
+            help='Удалить индексы Meta.indexes и триггеры FTS на время '
+                 'загрузки и построить их заново в конце')
+
+    def handle(self, *args, paths, **options):
+        loader = Loader(batch_size=options['batch_size'],
+                        chunk_size=options['chunk_size'],
+                        ignore_conflicts=options['ignore_conflicts'],
+                        drop_indexes=options['drop_indexes'])
+        loaded = loader.load(paths)
+        for label, count in loaded.items():
+            self.stdout.write(f'{label}: {count}')
+        self.stdout.write(f'Пропущено объектов других моделей: '
+                          f'{loader.skipped}')
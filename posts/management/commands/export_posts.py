@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты и комментарии пользователя в JSONL или CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument(
+            '--format', choices=sorted(export.FORMATS), default='jsonl')
+        parser.add_argument(
+            '--output', help='Файл для выгрузки (по умолчанию stdout)')
+
+    def handle(self, *args, username, **options):
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            raise CommandError(f'Пользователь {username} не найден')
+        lines = export.stream(user, options['format'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8',
+                  newline='') as output:
+            output.writelines(lines)
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from posts.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = ('Создаёт синтетических пользователей, подписки (степенной '
+            'закон), посты с сообществами и картинками и комментарии')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=30000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок пользователя')
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.1,
+            help='Доля постов с картинкой')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = generate(
+            users=options['users'], posts=options['posts'],
+            comments=options['comments'], groups=options['groups'],
+            follows=options['follows'], image_ratio=options['image_ratio'],
+            seed=options['seed'], batch_size=options['batch_size'])
+        for name, count in created.items():
+            self.stdout.write(f'{name}: {count}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Строит варианты изображений для постов, у которых их ещё нет'
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(
+            image__isnull=True).only('image')
+        built = 0
+        for post in posts.iterator():
+            if thumbnails.card_variants(post.image) is None:
+                thumbnails.generate(post.image)
+                built += 1
+        self.stdout.write(f'Построено миниатюр: {built}')
@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Post, User
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочная проверка записи: потоки одновременно публикуют '
+            'посты и комментарии через new_post и add_comment')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--requests', type=int, default=25,
+            help='Пар «пост + комментарий» на поток')
+
+    def handle(self, *args, threads, requests, **options):
+        users = [User.objects.get_or_create(username=f'hammer_{i}')[0]
+                 for i in range(threads)]
+        before = Post.objects.count()
+        results = Counter()
+        lock = threading.Lock()
+
+        def worker(user):
+            client = Client(HTTP_HOST='localhost')
+            client.force_login(user)
+            try:
+                for i in range(requests):
+                    response = client.post(reverse('new_post'),
+                                           {'text': f'{user.username} {i}'})
+                    post = Post.objects.filter(author=user).latest('pk')
+                    comment = client.post(
+                        reverse('add_comment', kwargs={
+                            'username': user.username, 'post_id': post.pk}),
+                        {'text': f'комментарий {i}'})
+                    with lock:
+                        results[response.status_code] += 1
+                        results[comment.status_code] += 1
+            except Exception as error:
+                with lock:
+                    results[type(error).__name__] += 1
+            finally:
+                connection.close()
+
+        started = time.monotonic()
+        workers = [threading.Thread(target=worker, args=(user,))
+                   for user in users]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.monotonic() - started
+        created = Post.objects.count() - before
+        self.stdout.write(f'Ответы: {dict(results)}')
+        self.stdout.write(f'Постов создано: {created} за {elapsed:.1f} с')
+        failed = sum(count for key, count in results.items() if key != 302)
+        if failed or created != threads * requests:
+            raise CommandError(f'Ошибок: {failed}')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.timelines import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает материализованные ленты подписок '
+            '(нужно после включения POSTS_TIMELINES)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='Пересобрать ленту только указанного пользователя')
+
+    def handle(self, *args, user_ids=None, **options):
+        follows = rebuild(user_ids)
+        self.stdout.write(f'Обработано подписок: {follows}')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_user_stats
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики UserStats по постам и подпискам'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', action='append', dest='usernames',
+            help='Пересчитать только указанного пользователя (можно повторять)')
+
+    def handle(self, *args, usernames=None, **options):
+        users = User.objects.all()
+        if usernames:
+            users = users.filter(username__in=usernames)
+        updated = reconcile_user_stats(users)
+        self.stdout.write(f'Обновлено пользователей: {updated}')
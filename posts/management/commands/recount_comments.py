@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import recount_comments
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает Post.comment_count по таблице комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--post', type=int, action='append', dest='post_ids',
+            help='Пересчитать только указанные посты (можно повторять)')
+
+    def handle(self, *args, post_ids=None, **options):
+        posts = Post.objects.all()
+        if post_ids:
+            posts = posts.filter(pk__in=post_ids)
+        updated = recount_comments(posts)
+        self.stdout.write(f'Обновлено постов: {updated}')
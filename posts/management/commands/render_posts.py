@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.rendering import backfill
+
+
+class Command(BaseCommand):
+    help = ('Заполняет Post.text_html и Post.preview_html для постов, '
+            'сохранённых до их появления')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', dest='render_all',
+            help='Перерендерить все посты, а не только незаполненные')
+        parser.add_argument(
+            '--post', type=int, action='append', dest='post_ids',
+            help='Только указанные посты (можно повторять)')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, render_all=False, post_ids=None, **options):
+        posts = Post.objects.all()
+        if post_ids:
+            posts = posts.filter(pk__in=post_ids)
+        updated = backfill(posts, missing_only=not render_all,
+                           batch_size=options['batch_size'])
+        self.stdout.write(f'Обновлено постов: {updated}')
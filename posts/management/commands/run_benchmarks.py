@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Замеряет представления на текущей базе: p50/p95, запросы '
+            'и память на запрос; сохраняет и сравнивает базовые линии. '
+            'new_post и add_comment пишут в базу')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios', nargs='*', metavar='scenario',
+            help='Сценарии: ' + ', '.join(benchmark.SCENARIOS))
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--cold-cache', action='store_true',
+            help='Очищать кеш перед каждым запросом')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--save-baseline', metavar='PATH',
+            help='Сохранить результаты как базовую линию (JSON)')
+        parser.add_argument(
+            '--compare', metavar='PATH',
+            help='Сравнить с сохранённой базовой линией')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост p95 и числа запросов при --compare')
+
+    def handle(self, *args, scenarios, **options):
+        unknown = set(scenarios) - set(benchmark.SCENARIOS)
+        if unknown:
+            raise CommandError('Неизвестные сценарии: ' + ', '.join(unknown))
+        try:
+            results = benchmark.run(
+                scenarios or None, requests=options['requests'],
+                warmup=options['warmup'], cold_cache=options['cold_cache'],
+                seed=options['seed'])
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(
+            f'{"сценарий":<14}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"запросов":>10}{"пик, КиБ":>10}{"ошибок":>8}')
+        for name, row in results.items():
+            self.stdout.write(
+                f'{name:<14}{row["p50_ms"]:>10}{row["p95_ms"]:>10}'
+                f'{row["queries"]:>10}{row["peak_kib"]!s:>10}'
+                f'{row["errors"]:>8}')
+        if options['save_baseline']:
+            benchmark.save_baseline(results, options['save_baseline'])
+        if options['compare']:
+            lines, regressions = benchmark.compare(
+                results, benchmark.load_baseline(options['compare']),
+                options['threshold'])
+            for line in lines:
+                self.stdout.write(line)
+            if regressions:
+                raise CommandError('Регрессии: ' + ', '.join(regressions))
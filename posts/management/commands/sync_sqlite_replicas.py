@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import caching
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик '
+            '(YATUBE_SQLITE_REPLICAS) для локальной проверки')
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict['NAME']
+        for alias in settings.DATABASE_REPLICAS:
+            replica = connections[alias].settings_dict
+            if replica['ENGINE'] != 'django.db.backends.sqlite3':
+                continue
+            # backup() даёт согласованную копию даже под нагрузкой
+            source = sqlite3.connect(primary)
+            target = sqlite3.connect(replica['NAME'])
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+                source.close()
+            self.stdout.write(f'{alias}: {replica["NAME"]}')
+        # Кеши, заполненные с отстававших реплик, больше не используются
+        caching.bump(caching.GLOBAL)
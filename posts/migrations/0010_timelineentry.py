@@ -0,0 +1,36 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='date published')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-pub_date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='posts_timeline_user_feed'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('user', 'post')},
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_user_stats(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+
+    def count(queryset, field):
+        return Coalesce(Subquery(
+            queryset.filter(**{field: OuterRef('user')}).order_by().values(
+                field).annotate(total=Count('id')).values('total')), 0)
+
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in
+         User.objects.values_list('pk', flat=True)],
+        batch_size=500)
+    UserStats.objects.update(
+        posts_count=count(Post.objects, 'author'),
+        followers_count=count(Follow.objects, 'author'),
+        following_count=count(Follow.objects, 'user'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписан')),
+            ],
+        ),
+        migrations.RunPython(fill_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from posts import fts
+
+
+def create_fts(apps, schema_editor):
+    fts.create(schema_editor)
+
+
+def drop_fts(apps, schema_editor):
+    fts.drop(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_userstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.6 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_fts'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created', '-id'], name='posts_comment_post_page'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['author', 'user'], name='posts_follow_author_user'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='posts_post_author_feed'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='posts_post_group_feed'),
+        ),
+    ]
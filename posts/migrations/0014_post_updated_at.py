@@ -0,0 +1,38 @@
+# Generated by Django 2.2.6 on 2026-10-18 19:02
+
+from django.db import migrations, models
+from django.db.models import F
+import django.utils.timezone
+
+from posts import fts
+
+
+def fill_updated_at(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(updated_at=F('pub_date'))
+
+
+def restore_fts_triggers(apps, schema_editor):
+    # SQLite пересоздал posts_post при AddField и потерял триггеры FTS
+    fts.create_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_feed_indexes'),
+    ]
+
+    operations = [
+        # При откате RemoveField тоже пересоздаёт таблицу: триггеры
+        # восстанавливаются последней операцией отката
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='date updated'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
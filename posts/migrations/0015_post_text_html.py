@@ -0,0 +1,56 @@
+# Generated by Django 2.2.6 on 2026-10-18 19:41
+
+from django.db import migrations, models
+from django.template.defaultfilters import linebreaksbr
+from django.utils.text import Truncator
+
+from posts import fts
+
+# Рендер на момент миграции, не зависящий от posts.rendering
+PREVIEW_WORDS = 60
+PREVIEW_ENDING = '…'
+BATCH_SIZE = 500
+
+
+def fill_text_html(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.only('id', 'text').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            return
+        for post in batch:
+            post.text_html = linebreaksbr(post.text)
+            post.preview_html = Truncator(post.text_html).words(
+                PREVIEW_WORDS, html=True, truncate=PREVIEW_ENDING)
+        Post.objects.bulk_update(batch, ['text_html', 'preview_html'])
+        last_pk = batch[-1].pk
+
+
+def restore_fts_triggers(apps, schema_editor):
+    # SQLite пересоздал posts_post при AddField и потерял триггеры FTS
+    fts.create_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_fts_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='preview_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_text_html, migrations.RunPython.noop),
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -32,12 +32,29 @@ class Post(models.Model):
                               blank=True,
                               null=True)
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comment_count = models.PositiveIntegerField(
+        verbose_name="Количество комментариев",
+        default=0,
+        editable=False)
+    # Версия карточки в кеше (posts.cards): меняется при каждом save()
+    updated_at = models.DateTimeField("date updated", auto_now=True)
+    # Готовый HTML текста (posts.rendering), заполняется в pre_save
+    text_html = models.TextField(blank=True, editable=False)
+    preview_html = models.TextField(blank=True, editable=False)
 
     def __str__(self):
         return self.text
 
     class Meta:
         ordering = ['-pub_date']
+        # Ленты автора и сообщества: фильтр и сортировка по ключам
+        # курсора (pub_date, id) одним индексом
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='posts_post_author_feed'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='posts_post_group_feed'),
+        ]
 
 
 class Comment(models.Model):
@@ -62,6 +79,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='posts_comment_post_page'),
+        ]
 
 
 class Follow(models.Model):
@@ -76,3 +97,51 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ("user", "author")
+        # Подписчики автора: раскладка лент и счётчики
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='posts_follow_author_user'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """
+    Материализованная лента подписок: пост автора, разложенный
+    по подписчикам при публикации (см. posts.timelines).
+    """
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name="timeline"
+                             )
+    post = models.ForeignKey(Post,
+                             on_delete=models.CASCADE,
+                             related_name="timeline_entries"
+                             )
+    # Копия Post.pub_date, чтобы лента читалась одним проходом по индексу
+    pub_date = models.DateTimeField("date published")
+
+    class Meta:
+        unique_together = ("user", "post")
+        ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='posts_timeline_user_feed'),
+        ]
+
+
+class UserStats(models.Model):
+    """
+    Счётчики профиля, которые поддерживаются при записи
+    (см. posts.counters), чтобы не считать их на каждой странице.
+    """
+    user = models.OneToOneField(User,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name="stats"
+                                )
+    posts_count = models.PositiveIntegerField("Записей", default=0)
+    followers_count = models.PositiveIntegerField("Подписчиков", default=0)
+    following_count = models.PositiveIntegerField("Подписан", default=0)
+
+    def __str__(self):
+        return str(self.user_id)
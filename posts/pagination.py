@@ -0,0 +1,238 @@
+import base64
+import json
+from functools import partial
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+
+FEED_KEYS = ('pub_date', 'id')
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(obj, keys=FEED_KEYS):
+    values = []
+    for key in keys:
+        value = getattr(obj, key)
+        values.append(value.isoformat() if hasattr(value, 'isoformat')
+                      else value)
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_values(cursor, size):
+    """Сырые значения курсора без приведения к типам полей модели."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw.decode())
+    except Exception:
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(cursor)
+    return values
+
+
+def decode_cursor(cursor, model, keys=FEED_KEYS):
+    values = decode_values(cursor, len(keys))
+    try:
+        return [model._meta.get_field(key).to_python(value)
+                for key, value in zip(keys, values)]
+    except Exception:
+        raise InvalidCursor(cursor)
+
+
+def _keyset_filter(keys, values, lookup):
+    """
+    Условие «строго после курсора» для сортировки по нескольким ключам:
+    (k0 < v0) OR (k0 = v0 AND k1 < v1) OR ...
+    """
+    condition = Q()
+    for i, key in enumerate(keys):
+        equal = {k: v for k, v in zip(keys[:i], values[:i])}
+        equal[f'{key}__{lookup}'] = values[i]
+        condition |= Q(**equal)
+    return condition
+
+
+class CursorPage:
+    """
+    Страница keyset-пагинации. Повторяет интерфейс Page,
+    который используют шаблоны, но не знает общего числа записей.
+    queryset — выполненный запрос страницы (с записью сверх страницы,
+    по которой видно, есть ли следующая); повторно к базе не обращается.
+    """
+
+    def __init__(self, object_list, has_next, has_previous, keys,
+                 queryset=None):
+        self.object_list = object_list
+        self.queryset = queryset
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.keys = keys
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_cursor(self):
+        return _edge_cursor(self, -1, self.keys)
+
+    def previous_cursor(self):
+        return _edge_cursor(self, 0, self.keys)
+
+
+class CursorPaginator:
+    """
+    Пагинация по ключам (pub_date, id) вместо OFFSET и COUNT(*):
+    каждая страница — один запрос по индексу, независимо от глубины.
+    """
+
+    def __init__(self, object_list, per_page, keys=FEED_KEYS):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.keys = tuple(keys)
+
+    def _ordering(self, descending):
+        prefix = '-' if descending else ''
+        return [prefix + key for key in self.keys]
+
+    def get_page(self, after=None, before=None):
+        model = self.object_list.model
+        try:
+            if after:
+                return self._older(decode_cursor(after, model, self.keys))
+            if before:
+                return self._newer(decode_cursor(before, model, self.keys))
+        except InvalidCursor:
+            pass
+        return self._older(None)
+
+    def _older(self, values):
+        queryset = self.object_list.order_by(*self._ordering(True))
+        if values is not None:
+            queryset = queryset.filter(
+                _keyset_filter(self.keys, values, 'lt'))
+        queryset = queryset[:self.per_page + 1]
+        items = list(queryset)
+        return CursorPage(items[:self.per_page],
+                          has_next=len(items) > self.per_page,
+                          has_previous=values is not None,
+                          keys=self.keys, queryset=queryset)
+
+    def _newer(self, values):
+        queryset = self.object_list.order_by(*self._ordering(False)).filter(
+            _keyset_filter(self.keys, values, 'gt'))
+        items = list(queryset[:self.per_page + 1])
+        has_previous = len(items) > self.per_page
+        items = items[:self.per_page]
+        items.reverse()
+        return CursorPage(items, has_next=True,
+                          has_previous=has_previous, keys=self.keys)
+
+
+def _edge_cursor(page, index, keys):
+    """
+    Курсор крайней записи страницы: последней для «старее»,
+    первой для «новее». None, если в ту сторону листать некуда.
+    """
+    available = page.has_next() if index == -1 else page.has_previous()
+    if not available or not len(page):
+        return None
+    return encode_cursor(page[index], keys)
+
+
+def counted_paginator(object_list, per_page, count=None):
+    """
+    Paginator, которому число записей известно заранее (из счётчика
+    или кеша), поэтому COUNT(*) не выполняется. Тип остаётся обычным
+    Paginator: его ожидают шаблоны и тесты.
+    """
+    paginator = Paginator(object_list, per_page)
+    if count is not None:
+        # Paginator.count — cached_property: значение в __dict__
+        # заменяет вычисление
+        paginator.__dict__['count'] = count
+    return paginator
+
+
+def page_window(page, neighbors=2):
+    """
+    Номера страниц для навигации: первая, последняя и соседи текущей,
+    пропуски обозначены None. В отличие от page_range, длина не зависит
+    от числа страниц.
+    """
+    last = page.paginator.num_pages
+    shown = sorted(
+        number for number in {1, last, *range(page.number - neighbors,
+                                               page.number + neighbors + 1)}
+        if 1 <= number <= last)
+    window, previous = [], 0
+    for number in shown:
+        if number - previous == 2:
+            # Пропуск в одну страницу не короче самой ссылки
+            window.append(previous + 1)
+        elif number - previous > 2:
+            window.append(None)
+        window.append(number)
+        previous = number
+    return window
+
+
+def get_page(request, object_list, per_page, keys=FEED_KEYS, count=None):
+    """
+    Возвращает (paginator, page) для ленты.
+
+    Запросы с ?after=/?before= обслуживает CursorPaginator. Первая страница
+    и старые ссылки вида ?page=N идут через обычный Paginator, а курсоры
+    «старее/новее» вычисляются из крайних записей страницы, так что
+    дальше по ленте пользователь переходит уже без OFFSET.
+
+    count — функция, возвращающая число записей ленты без COUNT(*)
+    (см. caching.cached_count); вызывается только для нумерованных страниц.
+
+    Курсоры — методы страницы, поэтому страница не выполняется,
+    пока её не прочитает шаблон (например, при попадании в кеш фрагмента).
+    """
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    ordering = ['-' + key for key in keys]
+    if after or before:
+        paginator = CursorPaginator(object_list, per_page, keys)
+        return paginator, paginator.get_page(after=after, before=before)
+    paginator = counted_paginator(object_list.order_by(*ordering), per_page,
+                                  count() if count else None)
+    page = paginator.get_page(request.GET.get('page'))
+    page.next_cursor = partial(_edge_cursor, page, -1, keys)
+    page.previous_cursor = partial(_edge_cursor, page, 0, keys)
+    return paginator, page
+
+
+def map_page(page, func):
+    """
+    Заменяет записи страницы результатом func, сохранив курсоры,
+    посчитанные по исходным записям (например, TimelineEntry -> Post).
+    """
+    next_cursor, previous_cursor = page.next_cursor(), page.previous_cursor()
+    page.object_list = [func(obj) for obj in page]
+    page.next_cursor = lambda: next_cursor
+    page.previous_cursor = lambda: previous_cursor
+    return page
@@ -0,0 +1,49 @@
+"""
+HTML текста поста, подготовленный при записи.
+
+Экранирование и linebreaksbr выполняются один раз в pre_save
+(posts.signals), а шаблоны выводят готовые Post.text_html
+и Post.preview_html — сокращённую версию для лент.
+"""
+from django.conf import settings
+from django.template.defaultfilters import linebreaksbr
+from django.utils.text import Truncator
+
+from .models import Post
+
+PREVIEW_ENDING = '…'
+
+
+def _preview_words():
+    return getattr(settings, 'POST_PREVIEW_WORDS', 60)
+
+
+def render_post(post):
+    """Заполняет post.text_html и post.preview_html по post.text."""
+    post.text_html = linebreaksbr(post.text)
+    post.preview_html = Truncator(post.text_html).words(
+        _preview_words(), html=True, truncate=PREVIEW_ENDING)
+
+
+def backfill(posts=None, missing_only=True, batch_size=500):
+    """
+    Заполняет HTML уже сохранённых постов пачками по первичному ключу.
+    updated_at не меняется: вывод совпадает с прежним рендером шаблона.
+    Возвращает число обновлённых постов.
+    """
+    if posts is None:
+        posts = Post.objects.all()
+    model = posts.model
+    if missing_only:
+        posts = posts.filter(text_html='')
+    posts = posts.only('id', 'text').order_by('pk')
+    updated, last_pk = 0, 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return updated
+        for post in batch:
+            render_post(post)
+        model.objects.bulk_update(batch, ['text_html', 'preview_html'])
+        updated += len(batch)
+        last_pk = batch[-1].pk
@@ -0,0 +1,65 @@
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _is_lock_error(error):
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def _retry(func, label, before_retry=None):
+    """
+    Повторяет func, если SQLite ответил «database is locked» даже после
+    busy_timeout. Паузы растут экспоненциально со случайным разбросом,
+    чтобы конкурирующие запросы не сталкивались снова. Внутри внешней
+    транзакции повтор невозможен, и ошибка пробрасывается сразу.
+    """
+    retries = getattr(settings, 'DB_WRITE_RETRIES', 4)
+    delay = getattr(settings, 'DB_WRITE_RETRY_DELAY', 0.05)
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except OperationalError as error:
+            if (attempt == retries or connection.in_atomic_block
+                    or not _is_lock_error(error)):
+                raise
+            logger.warning('%s: %s, попытка %s', label, error, attempt + 1)
+        if before_retry is not None:
+            before_retry()
+        time.sleep(delay * 2 ** attempt * (1 + random.random()))
+
+
+def retry_on_lock(view):
+    """
+    Повторяет view целиком при блокировке базы. Подходит для view, чья
+    запись — одна транзакция: после фиксации в них ничего не пишется.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        def rewind_uploads():
+            # Загруженные файлы уже прочитаны формой прошлой попытки
+            for upload in request.FILES.values():
+                upload.seek(0)
+
+        return _retry(lambda: view(request, *args, **kwargs), request.path,
+                      rewind_uploads)
+    return wrapper
+
+
+def atomic_with_retries(func, label):
+    """
+    Выполняет func в transaction.atomic() и повторяет только эту
+    транзакцию. Для view, которые пишут и после неё (миниатюры поста):
+    повтор всего view создал бы запись второй раз.
+    """
+    def run():
+        with transaction.atomic():
+            return func()
+    return _retry(run, label)
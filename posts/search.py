@@ -0,0 +1,100 @@
+import re
+
+from django.db import connections, router
+
+from . import feeds, fts
+from .models import Post
+from .pagination import (CursorPage, CursorPaginator, InvalidCursor,
+                         decode_values)
+
+RANK_KEYS = ('rank', 'id')
+
+# Сортировку только по rank FTS5 выполняет сам, без временного B-дерева.
+# Равные rank он отдаёт в порядке rowid, на этом держится курсор (rank, id)
+SEARCH_SQL = """
+    SELECT posts_post.id, {table}.rank
+    FROM {table} JOIN posts_post ON posts_post.id = {table}.rowid
+    WHERE {table} MATCH %s {filters}
+    ORDER BY {table}.rank
+    LIMIT %s
+"""
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def match_expression(query):
+    """
+    Переводит пользовательский ввод в запрос FTS5: каждое слово берётся
+    в кавычки (операторы FTS5 не интерпретируются) и ищется по префиксу,
+    чтобы «кот» находил «коты» и «котики».
+    """
+    tokens = TOKEN_RE.findall(query)
+    return ' '.join('"{}"*'.format(token) for token in tokens)
+
+
+def search_posts(query, per_page, group=None, author=None, after=None):
+    """
+    Ищет посты по тексту. Результаты упорядочены по релевантности (bm25),
+    следующая страница выбирается курсором (rank, id) без OFFSET.
+    """
+    match = match_expression(query)
+    if not match:
+        return CursorPage([], False, False, RANK_KEYS)
+    # Поиск по индексу и загрузка постов идут в одну базу
+    using = router.db_for_read(Post)
+    if not fts.supported(connections[using]):
+        return _search_like(query, per_page, group, author, after)
+    filters = []
+    params = [match]
+    if group is not None:
+        filters.append('AND posts_post.group_id = %s')
+        params.append(group.pk)
+    if author is not None:
+        filters.append('AND posts_post.author_id = %s')
+        params.append(author.pk)
+    cursor = _rank_cursor(after)
+    if cursor is not None:
+        filters.append(
+            f'AND ({fts.TABLE}.rank > %s OR '
+            f'({fts.TABLE}.rank = %s AND posts_post.id > %s))')
+        params.extend([cursor[0], cursor[0], cursor[1]])
+    params.append(per_page + 1)
+    sql = SEARCH_SQL.format(table=fts.TABLE, filters=' '.join(filters))
+    with connections[using].cursor() as db:
+        db.execute(sql, params)
+        rows = db.fetchall()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    posts = feeds.feed_queryset().using(using).in_bulk(
+        [post_id for post_id, _ in rows])
+    results = []
+    for post_id, rank in rows:
+        post = posts.get(post_id)
+        if post is not None:
+            post.rank = rank
+            results.append(post)
+    # Поиск листается только вперёд: «новее» по релевантности не бывает
+    return CursorPage(results, has_next=has_next, has_previous=False,
+                      keys=RANK_KEYS)
+
+
+def _rank_cursor(after):
+    if not after:
+        return None
+    try:
+        rank, post_id = decode_values(after, len(RANK_KEYS))
+        return float(rank), int(post_id)
+    except (InvalidCursor, TypeError, ValueError):
+        return None
+
+
+def _search_like(query, per_page, group, author, after):
+    """Запасной вариант для СУБД без FTS5: подстрока, свежие сверху."""
+    posts = feeds.feed_queryset().filter(text__icontains=query)
+    if group is not None:
+        posts = posts.filter(group=group)
+    if author is not None:
+        posts = posts.filter(author=author)
+    page = CursorPaginator(posts, per_page).get_page(after=after)
+    page._has_previous = False
+    return page
@@ -0,0 +1,97 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, counters, rendering, timelines
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _post_feeds(post):
+    return caching.feeds_for(
+        post.author.username, post.group.slug if post.group_id else None)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw, **kwargs):
+    # При loaddata (raw) счётчики восстанавливает recount_comments
+    if created and not raw:
+        counters.increment_comment_count(instance.post_id)
+    caching.bump_on_commit(caching.post_page(instance.post_id),
+                           *caching.post_feeds(instance.post_id))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.decrement_comment_count(instance.post_id)
+    caching.bump_on_commit(caching.post_page(instance.post_id),
+                           *caching.post_feeds(instance.post_id))
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw, **kwargs):
+    # Для loaddata строку соберёт get_user_stats при первом обращении
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def post_changing(sender, instance, raw, **kwargs):
+    # loaddata оставляет HTML из фикстуры, если он там есть
+    if not (raw and instance.text_html):
+        rendering.render_post(instance)
+    # Пост мог сменить сообщество: старую ленту тоже нужно сбросить
+    if instance.pk and not raw:
+        instance._previous_feeds = caching.post_feeds(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        counters.adjust_user_stats(instance.author_id, posts_count=1)
+        if timelines.enabled():
+            timelines.fan_out(instance)
+    feeds = _post_feeds(instance)
+    previous = getattr(instance, '_previous_feeds', [])
+    counts = []
+    # Число постов меняется у лент, куда пост попал или откуда ушёл
+    if created or set(feeds) != set(previous):
+        counts = [caching.post_count(name) for name in {*feeds, *previous}]
+    caching.bump_on_commit(caching.post_page(instance.pk),
+                           *feeds, *previous, *counts)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.adjust_user_stats(instance.author_id, posts_count=-1)
+    feeds = _post_feeds(instance)
+    caching.bump_on_commit(caching.post_page(instance.pk), *feeds,
+                           *map(caching.post_count, feeds))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        counters.adjust_user_stats(instance.author_id, followers_count=1)
+        counters.adjust_user_stats(instance.user_id, following_count=1)
+        if timelines.enabled():
+            timelines.backfill(instance.user_id, instance.author_id)
+    caching.bump_on_commit(caching.profile_feed(instance.author.username),
+                           caching.profile_feed(instance.user.username),
+                           caching.follow_graph(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.adjust_user_stats(instance.author_id, followers_count=-1)
+    counters.adjust_user_stats(instance.user_id, following_count=-1)
+    if timelines.enabled():
+        timelines.prune(instance.user_id, instance.author_id)
+    caching.bump_on_commit(caching.profile_feed(instance.author.username),
+                           caching.profile_feed(instance.user.username),
+                           caching.follow_graph(instance.user_id))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # Название сообщества есть в карточках всех лент
+    caching.bump_on_commit(caching.GLOBAL)
@@ -0,0 +1,81 @@
+// Подгрузка следующих страниц фрагментами HTML.
+//
+// Ссылка с data-fragment внутри блока data-fragment-more заменяется
+// ответом с адреса data-fragment: очередной страницей и новой ссылкой.
+// Блок с data-autoload скрыт в разметке: скрипт показывает его вместо
+// обычной навигации data-pager и загружает сам, когда блок появляется
+// на экране (бесконечная прокрутка лент). Без JS ленты листаются
+// навигацией data-pager, а при ошибке запроса ссылка открывает
+// обычную страницу.
+(function () {
+    'use strict';
+
+    var observer = null;
+
+    function load(link) {
+        var more = link.closest('[data-fragment-more]');
+        if (!more || more.dataset.loading) {
+            return;
+        }
+        more.dataset.loading = 'true';
+        fetch(link.dataset.fragment, {
+            credentials: 'same-origin',
+            headers: {'X-Requested-With': 'XMLHttpRequest'}
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.text();
+        }).then(function (html) {
+            if (observer) {
+                observer.unobserve(more);
+            }
+            more.insertAdjacentHTML('beforebegin', html);
+            var next = more.previousElementSibling;
+            more.remove();
+            if (next && next.matches('[data-autoload]')) {
+                next.hidden = false;
+                watch(next);
+            }
+        }).catch(function () {
+            window.location.href = link.href;
+        });
+    }
+
+    function watch(more) {
+        if (observer) {
+            observer.observe(more);
+        }
+    }
+
+    document.addEventListener('click', function (event) {
+        var link = event.target.closest('a[data-fragment]');
+        if (link) {
+            event.preventDefault();
+            load(link);
+        }
+    });
+
+    document.addEventListener('DOMContentLoaded', function () {
+        var more = document.querySelector('[data-autoload]');
+        if (!more) {
+            return;
+        }
+        more.hidden = false;
+        document.querySelectorAll('[data-pager]').forEach(function (pager) {
+            pager.hidden = true;
+        });
+        // Без IntersectionObserver блок подгружается по нажатию
+        if (!('IntersectionObserver' in window)) {
+            return;
+        }
+        observer = new IntersectionObserver(function (entries) {
+            entries.forEach(function (entry) {
+                if (entry.isIntersecting) {
+                    load(entry.target.querySelector('a[data-fragment]'));
+                }
+            });
+        }, {rootMargin: '600px 0px'});
+        watch(more);
+    });
+}());
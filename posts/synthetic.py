@@ -0,0 +1,166 @@
+"""
+Генератор правдоподобных данных для нагрузочных замеров.
+
+Популярность авторов распределена по степенному закону: на немногих
+авторов подписано большинство, они же пишут больше постов. Посты идут
+по времени равномерно за последний год, комментарии чаще достаются
+свежим постам. Объекты пишутся пачками через insert_raw.
+"""
+import io
+import itertools
+import random
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from PIL import Image
+
+from . import thumbnails
+from .bulkload import insert_raw, refresh_derived
+from .models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    'кот собака утро вечер город река лес дорога дом окно чай кофе книга '
+    'музыка друг встреча погода солнце дождь снег праздник работа отпуск '
+    'фото прогулка парк море горы поезд самолёт концерт выставка'
+).split()
+IMAGE_COUNT = 8
+PERIOD = timedelta(days=365)
+
+
+def _next_pk(model):
+    return (model.objects.aggregate(top=Max('pk'))['top'] or 0) + 1
+
+
+def _text(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def _weights(size, alpha):
+    """Накопленные веса Ципфа для random.choices(cum_weights=...)."""
+    return list(itertools.accumulate(
+        1 / (rank + 1) ** alpha for rank in range(size)))
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _images(rng):
+    """Несколько общих картинок: постов много, файлов — единицы."""
+    names = []
+    for number in range(IMAGE_COUNT):
+        buffer = io.BytesIO()
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', (1280, 720), color).save(buffer, format='JPEG')
+        name = f'posts/synthetic-{number}.jpg'
+        if not default_storage.exists(name):
+            default_storage.save(name, buffer)
+        names.append(name)
+        thumbnails.generate(Post(image=name).image)
+    return names
+
+
+def generate(users=1000, posts=10000, comments=30000, groups=20,
+             follows=20, image_ratio=0.1, seed=0, batch_size=1000):
+    """
+    Добавляет пользователей, сообщества, подписки, посты и комментарии
+    к уже существующим данным. Возвращает число созданных объектов.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    start = now - PERIOD
+    created = {}
+
+    first_user = _next_pk(User)
+    user_ids = range(first_user, first_user + users)
+    for batch in _batches(user_ids, batch_size):
+        insert_raw(User, [
+            User(pk=pk, username=f'bench_{pk}', password='!',
+                 date_joined=start) for pk in batch], batch_size)
+    created['users'] = users
+
+    first_group = _next_pk(Group)
+    group_ids = range(first_group, first_group + groups)
+    insert_raw(Group, [
+        Group(pk=pk, title=f'Сообщество {pk}', slug=f'bench-{pk}',
+              description=_text(rng, 5, 15)) for pk in group_ids],
+        batch_size)
+    created['groups'] = groups
+
+    author_weights = _weights(users, 1.1)
+
+    def follow_pairs():
+        for user_id in user_ids:
+            # Pareto(2) со средним 2: в среднем follows подписок
+            wanted = min(users - 1, int(follows * rng.paretovariate(2) / 2))
+            authors = set()
+            for author in rng.choices(user_ids, cum_weights=author_weights,
+                                      k=wanted * 2):
+                if author != user_id:
+                    authors.add(author)
+                if len(authors) >= wanted:
+                    break
+            for author in authors:
+                yield user_id, author
+
+    first_follow = _next_pk(Follow)
+    created['follows'] = 0
+    for batch in _batches(follow_pairs(), batch_size):
+        with transaction.atomic():
+            insert_raw(Follow, [
+                Follow(pk=first_follow + created['follows'] + i,
+                       user_id=user_id, author_id=author_id)
+                for i, (user_id, author_id) in enumerate(batch)],
+                batch_size)
+        created['follows'] += len(batch)
+
+    images = _images(rng) if image_ratio and posts else []
+    step = PERIOD / max(posts, 1)
+
+    def post_date(index):
+        return start + step * index
+
+    first_post = _next_pk(Post)
+    for batch in _batches(range(posts), batch_size):
+        with transaction.atomic():
+            insert_raw(Post, [
+                Post(pk=first_post + index,
+                     text=_text(rng, 5, 60),
+                     pub_date=post_date(index),
+                     author_id=rng.choices(
+                         user_ids, cum_weights=author_weights)[0],
+                     group_id=(rng.choice(group_ids)
+                               if groups and rng.random() < 0.5 else None),
+                     image=(rng.choice(images)
+                            if images and rng.random() < image_ratio
+                            else ''))
+                for index in batch], batch_size)
+    created['posts'] = posts
+
+    first_comment = _next_pk(Comment)
+    for batch in _batches(range(comments if posts else 0), batch_size):
+        objects = []
+        for number in batch:
+            # Свежие посты комментируют чаще
+            index = min(posts - 1, int(posts * (1 - rng.random() ** 3)))
+            objects.append(Comment(
+                pk=first_comment + number,
+                post_id=first_post + index,
+                author_id=rng.choice(user_ids),
+                text=_text(rng, 2, 20),
+                created=min(now, post_date(index)
+                            + timedelta(hours=rng.uniform(0, 48)))))
+        with transaction.atomic():
+            insert_raw(Comment, objects, batch_size)
+    created['comments'] = comments if posts else 0
+
+    refresh_derived()
+    return created
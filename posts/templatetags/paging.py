@@ -0,0 +1,11 @@
+from django import template
+
+from posts.pagination import page_window
+
+register = template.Library()
+
+
+@register.filter
+def window(page):
+    """Номера страниц вокруг текущей, None на месте пропуска."""
+    return page_window(page)
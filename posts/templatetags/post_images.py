@@ -0,0 +1,39 @@
+from django import template
+
+from posts import cards, thumbnails
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/post_picture.html')
+def post_picture(post):
+    """
+    <picture> карточки поста с WebP и srcset. Тег никогда не вызывает PIL:
+    варианты строятся после сохранения поста (posts.thumbnails), а пока
+    их нет, показывается оригинал.
+    """
+    if hasattr(post, 'card_variants'):
+        variants = post.card_variants
+    else:
+        variants = thumbnails.card_variants(post.image)
+    return {
+        'post': post,
+        'variants': variants,
+        'width': thumbnails.CARD_SIZE[0],
+        'height': thumbnails.CARD_SIZE[1],
+    }
+
+
+@register.simple_tag
+def prefetch_post_cards(page):
+    """
+    Достаёт карточки всей страницы из кеша одним get_many
+    до того, как post_card начнёт их выводить.
+    """
+    cards.prefetch(list(page))
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post, full_text=False):
+    return cards.render_card(post, context['user'], full_text)
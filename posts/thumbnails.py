@@ -0,0 +1,181 @@
+from django.conf import settings
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import background, caching
+from .models import Post
+
+# Карточка поста: кадр 960x339 в нескольких ширинах для srcset,
+# каждая в WebP и в формате оригинала (THUMBNAIL_PRESERVE_FORMAT)
+CARD_SIZE = (960, 339)
+CARD_WIDTHS = (320, 640, 960)
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+def _card_variants():
+    variants = {}
+    for width in CARD_WIDTHS:
+        height = round(width * CARD_SIZE[1] / CARD_SIZE[0])
+        geometry = f'{width}x{height}'
+        variants[f'card-{width}'] = (geometry, dict(CARD_OPTIONS))
+        variants[f'card-{width}-webp'] = (
+            geometry, dict(CARD_OPTIONS, format='WEBP'))
+    return variants
+
+
+# Варианты изображения поста: имя -> (геометрия, опции sorl-thumbnail)
+VARIANTS = _card_variants()
+CARD = f'card-{CARD_SIZE[0]}'
+
+
+class PostThumbnailBackend(ThumbnailBackend):
+    """
+    Бэкенд sorl-thumbnail, который умеет только искать готовую миниатюру:
+    имя файла вычисляется так же, как в get_thumbnail, но без PIL.
+    """
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def lookup(self, file_, geometry_string, **options):
+        thumbnail = self.thumbnail_file(file_, geometry_string, **options)
+        return default.kvstore.get(thumbnail)
+
+
+backend = PostThumbnailBackend()
+
+
+def lookup(image, variant):
+    """Готовая миниатюра из KV-хранилища или None, если её ещё нет."""
+    if not image:
+        return None
+    geometry, options = VARIANTS[variant]
+    return backend.lookup(image, geometry, **options)
+
+
+def card_variants(image):
+    """
+    Готовые варианты карточки: {'src', 'srcset', 'webp_srcset'}
+    или None, пока они не построены.
+    """
+    found = {name: lookup(image, name) for name in VARIANTS}
+    if not all(found.values()):
+        return None
+    return _card_sources(found)
+
+
+def lookup_many(thumbnail_files):
+    """
+    Пакетный kvstore.get: один cache.get_many и, для промахов,
+    один запрос к таблице thumbnail_kvstore вместо запроса на файл.
+    Возвращает {ключ файла: ImageFile} только для найденных.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, cached_db_kvstore.KVStore):
+        found = {f.key: kvstore.get(f) for f in thumbnail_files}
+        return {key: value for key, value in found.items() if value}
+    raw_keys = {add_prefix(f.key): f.key for f in thumbnail_files}
+    values = kvstore.cache.get_many(list(raw_keys))
+    missing = [key for key in raw_keys if key not in values]
+    if missing:
+        rows = dict(KVStoreModel.objects.filter(key__in=missing).values_list(
+            'key', 'value'))
+        # Как и sorl, запоминаем в кеше и отсутствие записи
+        empty = cached_db_kvstore.EMPTY_VALUE
+        fetched = {key: rows.get(key, empty) for key in missing}
+        kvstore.cache.set_many(
+            fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return {
+        raw_keys[raw_key]: deserialize_image_file(value)
+        for raw_key, value in values.items()
+        if value and value != cached_db_kvstore.EMPTY_VALUE
+    }
+
+
+def prefetch_card_variants(posts):
+    """
+    Находит варианты карточек для всей страницы разом и сохраняет
+    результат в post.card_variants для тега post_picture.
+    """
+    files = {}
+    for post in posts:
+        if post.image:
+            files[post.pk] = {
+                name: backend.thumbnail_file(post.image, geometry, **options)
+                for name, (geometry, options) in VARIANTS.items()
+            }
+    found = lookup_many(
+        [f for variants in files.values() for f in variants.values()])
+    for post in posts:
+        variants = files.get(post.pk)
+        if variants is None:
+            post.card_variants = None
+            continue
+        images = {name: found.get(f.key) for name, f in variants.items()}
+        post.card_variants = (
+            _card_sources(images) if all(images.values()) else None)
+
+
+def _card_sources(found):
+    def srcset(suffix):
+        return ', '.join(
+            f'{found[f"card-{width}{suffix}"].url} {width}w'
+            for width in CARD_WIDTHS)
+    return {
+        'src': found[CARD].url,
+        'srcset': srcset(''),
+        'webp_srcset': srcset('-webp'),
+    }
+
+
+def generate(image):
+    """Строит все варианты изображения (PIL работает здесь, не в шаблоне)."""
+    for geometry, options in VARIANTS.values():
+        backend.get_thumbnail(image, geometry, **options)
+
+
+def _mode():
+    return getattr(settings, 'THUMBNAIL_PREGENERATE', 'background')
+
+
+def generate_for_post(post_id):
+    post = Post.objects.only('image').filter(pk=post_id).first()
+    if post is not None and post.image:
+        generate(post.image)
+        # Карточки и ленты могли закешироваться с запасной картинкой
+        Post.objects.filter(pk=post_id).update(updated_at=timezone.now())
+        caching.bump(*caching.post_feeds(post_id))
+
+
+def schedule(post):
+    """
+    Ставит построение миниатюр поста в пул потоков после фиксации
+    транзакции. THUMBNAIL_PREGENERATE = 'sync' строит их сразу,
+    None отключает предварительную генерацию.
+    """
+    mode = _mode()
+    if not mode or not post.image:
+        return
+    if mode == 'sync':
+        generate(post.image)
+        return
+    background.submit('thumbnails', generate_for_post, post.id,
+                      workers=getattr(settings, 'THUMBNAIL_WORKERS', 2))
@@ -0,0 +1,96 @@
+from django.conf import settings
+
+from . import background, caching
+from .models import Follow, Post, TimelineEntry
+
+BATCH_SIZE = 500
+
+
+def enabled():
+    return getattr(settings, 'POSTS_TIMELINES', False)
+
+
+def _sync_limit():
+    return getattr(settings, 'TIMELINE_SYNC_FANOUT_LIMIT', 1000)
+
+
+def _backfill_limit():
+    return getattr(settings, 'TIMELINE_BACKFILL_LIMIT', 200)
+
+
+def _entries(pairs):
+    return [TimelineEntry(user_id=user_id, post_id=post_id,
+                          pub_date=pub_date)
+            for user_id, post_id, pub_date in pairs]
+
+
+def fan_out_now(post_id):
+    """Раскладывает пост по лентам всех подписчиков автора пачками."""
+    post = Post.objects.only('id', 'author_id', 'pub_date').filter(
+        pk=post_id).first()
+    if post is None:
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list(
+        'user_id', flat=True).order_by('user_id')
+    batch = []
+    for user_id in followers.iterator(chunk_size=BATCH_SIZE):
+        batch.append((user_id, post.id, post.pub_date))
+        if len(batch) >= BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(
+                _entries(batch), ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(
+            _entries(batch), ignore_conflicts=True)
+
+
+def fan_out(post):
+    """
+    Небольшие аудитории раскладываются сразу, в запросе new_post.
+    Для авторов с большим числом подписчиков работа уходит в фоновый
+    поток после фиксации транзакции.
+    """
+    followers = Follow.objects.filter(author_id=post.author_id)
+    if followers.count() <= _sync_limit():
+        fan_out_now(post.id)
+        return
+    background.submit('timeline-fanout', _fan_out_later, post.id)
+
+
+def _fan_out_later(post_id):
+    fan_out_now(post_id)
+    # Записи появились уже после сохранения поста: ETag и число записей
+    # ленты подписок строятся от версий главной ленты, их нужно сменить
+    # ещё раз
+    caching.bump(caching.index_feed(),
+                 caching.post_count(caching.index_feed()))
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту подписчика последние посты нового автора."""
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id').values_list('id', 'pub_date')[:_backfill_limit()]
+    TimelineEntry.objects.bulk_create(
+        _entries((user_id, post_id, pub_date) for post_id, pub_date in posts),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def prune(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild(user_ids=None):
+    """Пересобирает ленты заново по текущему графу подписок."""
+    entries = TimelineEntry.objects.all()
+    follows = Follow.objects.all()
+    if user_ids:
+        entries = entries.filter(user_id__in=user_ids)
+        follows = follows.filter(user_id__in=user_ids)
+    entries.delete()
+    count = 0
+    for user_id, author_id in follows.values_list(
+            'user_id', 'author_id').iterator():
+        backfill(user_id, author_id)
+        count += 1
+    return count
@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path("new/", views.new_post, name="new_post"),
+    path("search/", views.search, name="search"),
     path("group/<slug:slug>/", views.group_posts, name="group_posts"),
     path("", views.index, name="index"),
     path(
@@ -19,6 +20,12 @@ urlpatterns = [
     path(
         '<str:username>/unfollow/', views.profile_unfollow,
         name="profile_unfollow"),
+    path(
+        '<str:username>/export/', views.export_posts,
+        name='export_posts'),
+    path(
+        '<str:username>/<int:post_id>/comments/', views.post_comments,
+        name='post_comments'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path('<str:username>/', views.profile, name='profile'),
 ]
@@ -1,51 +1,82 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
-from django.core.paginator import Paginator
-from .models import Post, Group, User, Comment, Follow
+from django.http import JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.db import transaction
+from .models import Post, Group, User, Follow
 from .forms import PostForm, CommentForm
+from .counters import get_user_stats
+from .pagination import CursorPaginator, get_page, map_page
+from . import caching, export, feeds, thumbnails, timelines
+from .search import search_posts
+from .conditional import conditional_feed
+from .retries import atomic_with_retries, retry_on_lock
 from django.urls import reverse
+from django.utils.http import urlencode
 
+COMMENTS_PER_PAGE = 3
+# Поля поста, которые пишет редактирование: comment_count ведут
+# add_comment и сигналы, и копия из формы могла устареть
+POST_EDIT_FIELDS = [field.name for field in Post._meta.concrete_fields
+                    if not field.primary_key and field.name != 'comment_count']
 
+
+@conditional_feed(lambda request, username: [caching.profile_feed(username)])
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, 3)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    follower_count = Follow.objects.filter(user=author).count()
-    following_count = Follow.objects.filter(author=author).count()
-    try:
-        following = Follow.objects.filter(user=request.user,
-            author=author).count()
-    except:
-        following = False
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    # Число записей берётся из поддерживаемого счётчика
+    stats = get_user_stats(author)
+    paginator, page = get_page(request, feeds.profile_feed(author), 3,
+                               count=lambda: stats.posts_count)
+    following = (request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author=author).exists())
     return render(
         request,
         'posts/profile.html',
         {'author': author, 'page': page, 'paginator': paginator,
-        'following': following, 'follower_count': follower_count,
-        'following_count': following_count}
+        'stats': stats, 'following': following,
+        **caching.feed_cache(request, caching.profile_feed(username))}
         )
 
 
+@conditional_feed(lambda request, username, post_id: [
+    caching.profile_feed(username), caching.post_page(post_id)])
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, author__username=username, id=post_id)
-    count = post.author.posts.count()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'),
+        author__username=username, id=post_id)
     form = CommentForm()
-    items = Comment.objects.select_related('author',
-        'post').filter(post_id=post_id)
-    paginator = Paginator(items, 3)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    # Первая страница комментариев встроена в страницу поста, следующие
+    # подгружает post_comments (без JS — ссылка ?after= на эту же страницу)
+    paginator = CursorPaginator(feeds.comment_feed(post_id),
+                                COMMENTS_PER_PAGE, feeds.COMMENT_KEYS)
+    page = paginator.get_page(after=request.GET.get('after'))
     return render(request, 'posts/post.html',
-                    {'count': count, 'post': post,
+                    {'stats': get_user_stats(post.author), 'post': post,
                     'form': form, 'author': post.author,
                     'paginator': paginator, 'page': page,
-                    'items': items}
+                    # Уже выполненный запрос страницы, а не все комментарии
+                    'comments': page.queryset,
+                    'username': username, 'post_id': post_id}
     )
 
 
+@conditional_feed(lambda request, username, post_id: [
+    caching.post_page(post_id)])
+def post_comments(request, username, post_id):
+    """
+    Одна страница комментариев фрагментом HTML: один запрос по индексу
+    (post, created, id) и шаблон списка без страницы поста.
+    """
+    paginator = CursorPaginator(feeds.comment_feed(post_id),
+                                COMMENTS_PER_PAGE, feeds.COMMENT_KEYS)
+    page = paginator.get_page(after=request.GET.get('after'))
+    return render(request, 'posts/comment_list.html',
+                  {'page': page, 'username': username, 'post_id': post_id})
+
+
 @login_required
 def new_post(request):
     context = {'title': 'Новая запись', 'botton': 'Добавить'}
@@ -62,7 +93,16 @@ def new_post(request):
         )
     post = form.save(commit=False)
     post.author = request.user
-    post.save()
+
+    def save():
+        # id от откаченной попытки мог уже занять другой пост
+        post.pk = None
+        post.save()
+
+    # Пост и счётчик записей автора сохраняются вместе. Повторяется
+    # только транзакция: миниатюры пишутся уже после фиксации
+    atomic_with_retries(save, request.path)
+    thumbnails.schedule(post)
     return redirect('index')
 
 
@@ -83,11 +123,15 @@ def post_edit(request, username, post_id):
         )
     post = form.save(commit=False)
     post.author = request.user
-    post.save()
+    atomic_with_retries(
+        lambda: post.save(update_fields=POST_EDIT_FIELDS), request.path)
+    if 'image' in form.changed_data:
+        thumbnails.schedule(post)
     return redirect(f'/{post.author.username}/{post.id}')
 
 
 @login_required
+@retry_on_lock
 def add_comment(request, username, post_id):
     post = get_object_or_404(
         Post, author__username=username, id=post_id)
@@ -103,33 +147,60 @@ def add_comment(request, username, post_id):
     comment = form.save(commit=False)
     comment.author = request.user
     comment.post = post
-    comment.save()
+    # Комментарий и счётчик comment_count сохраняются в одной транзакции
+    with transaction.atomic():
+        comment.save()
     return redirect(reverse('post',
         kwargs={'username': username, 'post_id': post_id})
         )
 
 
+def _render_feed(request, template, context):
+    """
+    Страница ленты целиком или, с ?fragment=html|json, только карточки
+    и курсор следующей страницы — для бесконечной прокрутки без
+    base.html, меню и подвала.
+    """
+    mode = request.GET.get('fragment')
+    if mode:
+        context = {**context, 'fragment': True}
+    if mode == 'html':
+        return render(request, 'posts/feed_fragment.html', context)
+    if mode == 'json':
+        html = render_to_string('posts/feed_cards.html', context, request)
+        return JsonResponse(
+            {'html': html, 'next': context['page'].next_cursor()},
+            json_dumps_params={'ensure_ascii': False,
+                               'separators': (',', ':')})
+    return render(request, template, context)
+
+
+@conditional_feed(lambda request: [caching.index_feed()])
 def index(request):
-    post = Post.objects.select_related('group').all()
-    paginator = Paginator(post, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(
+    posts = feeds.index_feed()
+    paginator, page = get_page(request, posts, 10, count=lambda: (
+        caching.cached_count(posts, [
+            caching.post_count(caching.index_feed())])))
+    return _render_feed(
         request,
         'index.html',
-        {'page': page, 'paginator': paginator}
+        {'page': page, 'paginator': paginator, 'separated': True,
+         **caching.feed_cache(request, caching.index_feed())}
     )
 
 
+@conditional_feed(lambda request, slug: [caching.group_feed(slug)])
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.post_group.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, "group.html",
-                  {'group': group, 'page': page, 'paginator': paginator}
-                  )
+    posts = feeds.group_feed(group)
+    paginator, page = get_page(request, posts, 10, count=lambda: (
+        caching.cached_count(posts, [
+            caching.post_count(caching.group_feed(slug))])))
+    return _render_feed(
+        request, "group.html",
+        {'group': group, 'page': page, 'paginator': paginator,
+         **caching.feed_cache(request, caching.group_feed(slug))}
+    )
 
 
 def page_not_found(request, exception):
@@ -148,29 +219,81 @@ def server_error(request):
 
 
 @login_required
+@conditional_feed(lambda request: [
+    caching.index_feed(), caching.follow_graph(request.user.pk)])
 def follow_index(request):
-    post = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(post, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(
+    # Подписки меняют состав ленты, новые посты любых авторов — её длину
+    def count(entries):
+        return lambda: caching.cached_count(entries, [
+            caching.post_count(caching.index_feed()),
+            caching.follow_graph(request.user.pk)])
+
+    if timelines.enabled():
+        entries = feeds.timeline_feed(request.user)
+        paginator, page = get_page(request, entries, 10,
+                                   keys=feeds.TIMELINE_KEYS,
+                                   count=count(entries))
+        map_page(page, lambda entry: entry.post)
+    else:
+        posts = feeds.follow_feed(request.user)
+        paginator, page = get_page(request, posts, 10, count=count(posts))
+    return _render_feed(
         request,
         'posts/follow.html',
-        {'page': page, 'paginator': paginator})
+        {'page': page, 'paginator': paginator, 'separated': True})
+
+
+@login_required
+def export_posts(request, username):
+    author = get_object_or_404(User, username=username)
+    if request.user != author and not request.user.is_staff:
+        return redirect('profile', username=username)
+    fmt = request.GET.get('format')
+    if fmt not in export.FORMATS:
+        fmt = 'jsonl'
+    response = StreamingHttpResponse(export.stream(author, fmt),
+                                     content_type=export.FORMATS[fmt])
+    response['Content-Disposition'] = (
+        f'attachment; filename="{username}.{fmt}"')
+    return response
 
 
 @login_required
+@retry_on_lock
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     follow = Follow.objects.filter(user=request.user, author=author).exists()
     if request.user.username != username and not follow:
-        Follow.objects.create(user=request.user, author=author)
+        with transaction.atomic():
+            Follow.objects.create(user=request.user, author=author)
     return redirect('follow_index')
 
 
 @login_required
+@retry_on_lock
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     follow = Follow.objects.filter(user=request.user, author=author)
-    follow.delete()
+    with transaction.atomic():
+        follow.delete()
     return redirect('follow_index')
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    group = author = None
+    if request.GET.get('group'):
+        group = get_object_or_404(Group, slug=request.GET['group'])
+    if request.GET.get('author'):
+        author = get_object_or_404(User, username=request.GET['author'])
+    page = search_posts(query, 10, group=group, author=author,
+                        after=request.GET.get('after'))
+    # Параметры поиска сохраняются в ссылке на следующую страницу
+    params = {'q': query}
+    if group is not None:
+        params['group'] = group.slug
+    if author is not None:
+        params['author'] = author.username
+    return render(request, 'posts/search.html',
+                  {'query': query, 'group': group, 'author': author,
+                   'page': page, 'query_string': urlencode(params)})
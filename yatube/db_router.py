@@ -0,0 +1,82 @@
+"""
+Маршрутизация запросов между основной базой и репликами для чтения.
+
+Чтение уходит на реплику только внутри представлений из
+DATABASE_REPLICA_VIEWS. Всё остальное, в том числе фоновые задачи
+и команды, работает с основной базой. После любой записи пользователь
+получает cookie, и следующие DATABASE_REPLICA_PIN_SECONDS секунд его
+запросы читают с основной базы: он сразу видит свой пост или комментарий,
+даже если реплика ещё отстаёт.
+"""
+import random
+import threading
+
+from django.conf import settings
+
+PRIMARY = 'default'
+PIN_COOKIE = 'db_primary'
+
+_state = threading.local()
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _reset():
+    _state.use_replica = False
+    _state.wrote = False
+
+
+def read_primary():
+    """Остаток текущего запроса читает с основной базы."""
+    _state.use_replica = False
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'use_replica', False) and replicas():
+            return random.choice(replicas())
+        return None
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        # Объект мог быть прочитан с реплики: сохраняем его всё равно
+        # в основную базу
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == PRIMARY
+
+
+class ReplicaRoutingMiddleware:
+    """Включает чтение с реплик для представлений из настроек."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _reset()
+        try:
+            response = self.get_response(request)
+            if _state.wrote:
+                response.set_cookie(
+                    PIN_COOKIE, '1', httponly=True,
+                    max_age=getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS',
+                                    15))
+        finally:
+            _reset()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        _state.use_replica = (
+            request.method in ('GET', 'HEAD')
+            and PIN_COOKIE not in request.COOKIES
+            and match is not None
+            and match.url_name in getattr(
+                settings, 'DATABASE_REPLICA_VIEWS', ()))
@@ -0,0 +1,89 @@
+"""
+Учёт SQL на запрос без debug_toolbar и DEBUG.
+
+Обёртка connection.execute_wrapper считает запросы и их время,
+а повторы одного и того же SQL (параметры передаются отдельно, поэтому
+текст запроса и есть его сигнатура) выдают N+1. Итог уходит в заголовок
+Server-Timing; медленные запросы, повторы и медленные ответы пишутся
+в лог yatube.sql для доли запросов SQL_LOG_SAMPLE_RATE.
+"""
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger('yatube.sql')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class QueryCollector:
+    __slots__ = ('count', 'duration', 'signatures', 'slow', 'slow_ms')
+
+    def __init__(self, slow_ms):
+        self.count = 0
+        self.duration = 0.0
+        self.signatures = Counter()
+        self.slow = []
+        self.slow_ms = slow_ms
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.duration += elapsed
+            self.signatures[sql] += 1
+            if elapsed >= self.slow_ms:
+                self.slow.append((elapsed, sql))
+
+    def duplicates(self, threshold):
+        return [(count, sql) for sql, count in self.signatures.items()
+                if count >= threshold]
+
+
+class SQLInstrumentationMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _setting('SQL_INSTRUMENTATION', True):
+            return self.get_response(request)
+        collector = QueryCollector(_setting('SQL_SLOW_QUERY_MS', 100))
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        total = (time.perf_counter() - started) * 1000
+        timing = (f'db;dur={collector.duration:.1f};'
+                  f'desc="{collector.count} queries", total;dur={total:.1f}')
+        if response.has_header('Server-Timing'):
+            timing = f'{response["Server-Timing"]}, {timing}'
+        response['Server-Timing'] = timing
+        if random.random() < _setting('SQL_LOG_SAMPLE_RATE', 0.1):
+            self._log(request, collector, total)
+        return response
+
+    def _log(self, request, collector, total):
+        match = request.resolver_match
+        view = match.view_name if match else request.path
+        for elapsed, sql in collector.slow:
+            logger.warning('Медленный запрос %.1f мс в %s: %s',
+                           elapsed, view, sql)
+        threshold = _setting('SQL_DUPLICATE_THRESHOLD', 5)
+        for count, sql in collector.duplicates(threshold):
+            logger.warning('Запрос повторён %d раз в %s (N+1?): %s',
+                           count, view, sql)
+        if total >= _setting('SQL_SLOW_REQUEST_MS', 500):
+            logger.warning('Медленный ответ %.1f мс в %s: %d запросов, '
+                           '%.1f мс в БД', total, view, collector.count,
+                           collector.duration)
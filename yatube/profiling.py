@@ -0,0 +1,176 @@
+"""
+Профилирование отдельных запросов по требованию.
+
+Запрос профилируется, если:
+- в заголовке X-Profile пришёл подписанный токен (manage.py profile_token);
+- сотрудник (is_staff) добавил к адресу ?_profile=1;
+- запрос попал в долю PROFILING_SAMPLE_RATE.
+
+Режим 'sample' раз в PROFILING_INTERVAL_MS снимает стек потока запроса
+и пишет свёрнутые стеки (*.collapsed, формат flamegraph.pl/speedscope);
+режим 'cprofile' пишет *.prof для pstats. Файлы кладутся в PROFILING_DIR,
+а manage.py aggregate_profiles сводит их вместе.
+"""
+import cProfile
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_PARAM = '_profile'
+SALT = 'yatube.profiling'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def make_token():
+    return signing.TimestampSigner(salt=SALT).sign('profile')
+
+
+def valid_token(token):
+    try:
+        signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=_setting('PROFILING_TOKEN_MAX_AGE', 60 * 60))
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix):
+            filename = filename[len(prefix):].lstrip(os.sep)
+            break
+    # «;» разделяет кадры в свёрнутом стеке
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(
+        ';', ':')
+
+
+class StackSampler:
+    """Снимает стек одного потока в фоне и считает одинаковые стеки."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as output:
+            for stack, count in self.stacks.items():
+                output.write(f'{stack} {count}\n')
+
+
+class CProfiler:
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path):
+        self.profile.dump_stats(path)
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _requested(self, request):
+        token = request.META.get(HEADER)
+        if token and valid_token(token):
+            return True
+        if request.GET.get(QUERY_PARAM) and request.user.is_staff:
+            return True
+        return random.random() < _setting('PROFILING_SAMPLE_RATE', 0)
+
+    def __call__(self, request):
+        if not self._requested(request):
+            return self.get_response(request)
+        if _setting('PROFILING_MODE', 'sample') == 'cprofile':
+            profiler, suffix = CProfiler(), 'prof'
+        else:
+            interval = _setting('PROFILING_INTERVAL_MS', 5) / 1000
+            profiler = StackSampler(threading.get_ident(), interval)
+            suffix = 'collapsed'
+        profiler.start()
+        try:
+            response = self.get_response(request)
+            # Ленивые TemplateResponse дорендериваются здесь же
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+        finally:
+            profiler.stop()
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        name = '{}-{}-{}.{}'.format(
+            time.strftime('%Y%m%d%H%M%S'), view.replace(':', '.'),
+            uuid.uuid4().hex[:8], suffix)
+        directory = _setting('PROFILING_DIR', 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump(os.path.join(directory, name))
+        response['X-Profile-File'] = name
+        return response
+
+
+def read_collapsed(paths):
+    """Суммирует свёрнутые стеки нескольких файлов."""
+    stacks = Counter()
+    for path in paths:
+        with open(path, encoding='utf-8') as collapsed:
+            for line in collapsed:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack and count.isdigit():
+                    stacks[stack] += int(count)
+    return stacks
+
+
+def pstats_to_collapsed(paths):
+    """
+    Свёрнутые стеки из файлов cProfile. pstats хранит только пары
+    «вызывающий — вызываемый», поэтому стеки двухуровневые: время
+    функции (tottime, в мкс) раскладывается по её вызывающим.
+    """
+    stats = pstats.Stats(*paths)
+    stacks = Counter()
+    for func, (_, _, tottime, _, callers) in stats.stats.items():
+        label = pstats.func_std_string(func).replace(';', ':')
+        if not callers:
+            stacks[label] += int(tottime * 1e6)
+            continue
+        for caller, caller_stats in callers.items():
+            caller_label = pstats.func_std_string(caller).replace(';', ':')
+            stacks[f'{caller_label};{label}'] += int(caller_stats[2] * 1e6)
+    return stacks
@@ -55,10 +55,13 @@ SITE_ID = 1
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'yatube.instrumentation.SQLInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'yatube.db_router.ReplicaRoutingMiddleware',
+    'yatube.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.contrib.flatpages.middleware.FlatpageFallbackMiddleware' 
@@ -91,12 +94,60 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# SQLite в режиме WAL, с ожиданием блокировок и BEGIN IMMEDIATE
+# (см. yatube/sqlite_backend); PRAGMAS переопределяют значения по умолчанию
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'ENGINE': 'yatube.sqlite_backend',
+        'NAME': os.environ.get('YATUBE_DB_PATH',
+                               os.path.join(BASE_DIR, 'db.sqlite3')),
+        'OPTIONS': {'timeout': 20},
+        'TRANSACTION_MODE': 'IMMEDIATE',
     }
 }
+# Повторы записи при «database is locked»: число попыток и начальная пауза
+DB_WRITE_RETRIES = 4
+DB_WRITE_RETRY_DELAY = 0.05
+
+# Учёт SQL на запрос (yatube.instrumentation): заголовок Server-Timing
+# и выборочный лог yatube.sql с медленными запросами, повторами (N+1)
+# и медленными ответами
+SQL_INSTRUMENTATION = True
+SQL_SLOW_QUERY_MS = 100
+SQL_SLOW_REQUEST_MS = 500
+SQL_DUPLICATE_THRESHOLD = 5
+SQL_LOG_SAMPLE_RATE = 0.1
+
+# Профилирование запросов по требованию (yatube.profiling): заголовок
+# X-Profile с токеном из manage.py profile_token, ?_profile=1 для
+# сотрудников или доля PROFILING_SAMPLE_RATE всех запросов
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_MODE = 'sample'  # или 'cprofile'
+PROFILING_INTERVAL_MS = 5
+PROFILING_SAMPLE_RATE = 0
+PROFILING_TOKEN_MAX_AGE = 60 * 60
+
+# Реплики только для чтения. Для локальной проверки подходят копии
+# db.sqlite3, которые обновляет manage.py sync_sqlite_replicas:
+# YATUBE_SQLITE_REPLICAS=replica1.sqlite3,replica2.sqlite3
+DATABASE_REPLICAS = []
+for number, name in enumerate(filter(None, os.environ.get(
+        'YATUBE_SQLITE_REPLICAS', '').split(',')), 1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, name),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['yatube.db_router.PrimaryReplicaRouter']
+# Представления (имена URL), которые читают с реплик
+DATABASE_REPLICA_VIEWS = [
+    'index', 'group_posts', 'profile', 'post', 'follow_index', 'search',
+    'api_posts', 'api_group_posts', 'api_profile_posts', 'api_post_comments',
+]
+# Сколько секунд после записи запросы пользователя читают основную базу
+DATABASE_REPLICA_PIN_SECONDS = 15
 
 
 # Password validation
@@ -154,11 +205,51 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Материализованные ленты подписок (posts.timelines). После включения
+# заполните таблицу командой rebuild_timelines.
+POSTS_TIMELINES = False
+# Авторы с большим числом подписчиков раскладываются в фоновом потоке
+TIMELINE_SYNC_FANOUT_LIMIT = 1000
+# Сколько последних постов автора добавить в ленту при подписке
+TIMELINE_BACKFILL_LIMIT = 200
+
+# Кеш. Версии ключей лент (posts.caching) сбрасывают сигналы одного
+# процесса и команды manage.py (bulkload, sync_sqlite_replicas,
+# recount_comments), поэтому долгие TTL безопасны только с кешем, общим
+# для всех процессов: memcached по адресу YATUBE_MEMCACHED
+# (например 127.0.0.1:11211, нужен пакет python-memcached).
+# LocMemCache у каждого процесса свой и чужих сбросов не видит:
+# фрагменты, карточки и сами версии живут в нём недолго.
+MEMCACHED_LOCATION = os.environ.get('YATUBE_MEMCACHED')
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': MEMCACHED_LOCATION,
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Время жизни фрагментов лент и закешированного числа постов
+FEED_CACHE_TIMEOUT = 60 * 60 if MEMCACHED_LOCATION else 20
+# Кешированные карточки постов (posts.cards)
+CARD_CACHE_TIMEOUT = 24 * 60 * 60 if MEMCACHED_LOCATION else 20
+# Версии лент; None — бессрочно. Без общего кеша истекают вместе
+# с фрагментами, чтобы ETag и счётчики не пережили чужой сброс
+FEED_VERSION_TIMEOUT = None if MEMCACHED_LOCATION else FEED_CACHE_TIMEOUT
+
+# Миниатюры постов строятся после сохранения в пуле потоков
+# ('background'), сразу в запросе ('sync') или не строятся заранее (None)
+THUMBNAIL_PREGENERATE = 'background'
+THUMBNAIL_WORKERS = 2
+# Варианты карточек сохраняются в формате оригинала и дополнительно в WebP
+THUMBNAIL_PRESERVE_FORMAT = True
+# Большая сторона загруженного оригинала после нормализации
+POST_IMAGE_MAX_SIZE = 2560
 
 # INTERNAL_IPS = [
 #     # ...
@@ -1,6 +1,24 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import HttpResponse
 from django.test import TestCase
 from django.test import Client
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+from posts import caching
 from posts.models import User
+from posts.tests import committed
+from yatube import db_router, instrumentation, profiling
+from yatube.instrumentation import SQLInstrumentationMiddleware
 
 
 
@@ -23,3 +41,155 @@ class TestYatube(TestCase):
         for client in self.clients:
             response = self.client.get('fdgdfgdfg')
             self.assertEqual(response.status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=['default'])
+class TestReplicaRouting(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='router_user')
+        self.client.force_login(self.user)
+        self.client.cookies.pop(db_router.PIN_COOKIE, None)
+
+    def _age_versions(self, *names):
+        # Версии старше допустимого отставания реплики
+        old = time.time() - settings.DATABASE_REPLICA_PIN_SECONDS - 1
+        cache.set_many({caching.VERSION_KEY.format(name): f'{old:.6f}-old'
+                        for name in (caching.GLOBAL, *names)}, None)
+
+    def _replica_reads(self, method, url, data=None):
+        with mock.patch.object(db_router.random, 'choice',
+                               wraps=db_router.random.choice) as choice:
+            response = getattr(self.client, method)(url, data)
+        return response, choice.call_count
+
+    def test_feed_reads_replica(self):
+        self._age_versions(caching.index_feed(),
+                           caching.post_count(caching.index_feed()))
+        _, reads = self._replica_reads('get', reverse('index'))
+        self.assertGreater(reads, 0)
+        _, reads = self._replica_reads('get', reverse('new_post'))
+        self.assertEqual(reads, 0)
+
+    def test_read_your_writes(self):
+        """
+        После записи запросы пользователя читают основную базу
+        """
+        with committed():
+            response, reads = self._replica_reads(
+                'post', reverse('new_post'), {'text': 'с основной базы'})
+        self.assertEqual(reads, 0)
+        self.assertIn(db_router.PIN_COOKIE, response.cookies)
+        response, reads = self._replica_reads('get', reverse('index'))
+        self.assertEqual(reads, 0)
+        self.assertContains(response, 'с основной базы')
+
+
+    def test_fresh_version_reads_primary(self):
+        """
+        Сразу после смены версии ленты её кеши заполняются с основной
+        базы, а не с реплики, которая может отставать
+        """
+        self._age_versions(caching.index_feed(),
+                           caching.post_count(caching.index_feed()))
+        caching.bump(caching.index_feed())
+        _, reads = self._replica_reads('get', reverse('index'))
+        self.assertEqual(reads, 0)
+
+    def test_sync_bumps_versions(self):
+        self._age_versions()
+        before, = caching.get_versions(caching.GLOBAL)
+        call_command('sync_sqlite_replicas', stdout=io.StringIO())
+        self.assertNotEqual(caching.get_versions(caching.GLOBAL), [before])
+
+
+class TestSQLInstrumentation(TestCase):
+    def test_server_timing(self):
+        response = self.client.get(reverse('index'))
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", total;dur=')
+
+    @override_settings(SQL_LOG_SAMPLE_RATE=1, SQL_DUPLICATE_THRESHOLD=3,
+                       SQL_SLOW_QUERY_MS=10 ** 6)
+    def test_duplicates_logged(self):
+        """
+        Один и тот же SQL в цикле попадает в лог как возможный N+1
+        """
+        def view(request):
+            for pk in range(4):
+                User.objects.filter(pk=pk).first()
+            return HttpResponse()
+
+        middleware = SQLInstrumentationMiddleware(view)
+        with self.assertLogs('yatube.sql', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/n-plus-one/'))
+        self.assertIn('4 queries', response['Server-Timing'])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('повторён 4 раз в /n-plus-one/', logs.output[0])
+
+    @override_settings(SQL_LOG_SAMPLE_RATE=1, SQL_SLOW_QUERY_MS=0,
+                       SQL_SLOW_REQUEST_MS=0)
+    def test_slow_log_has_view_name(self):
+        cache.clear()
+        with self.assertLogs('yatube.sql', 'WARNING') as logs:
+            self.client.get(reverse('index'))
+        self.assertTrue(any('Медленный ответ' in line and ' index:' in line
+                            for line in logs.output))
+        self.assertTrue(any('Медленный запрос' in line
+                            for line in logs.output))
+
+    @override_settings(SQL_LOG_SAMPLE_RATE=0, SQL_SLOW_QUERY_MS=0)
+    def test_sampling(self):
+        with mock.patch.object(instrumentation.logger, 'warning') as warning:
+            self.client.get(reverse('index'))
+        warning.assert_not_called()
+
+
+class TestProfiling(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.settings_override = override_settings(
+            PROFILING_DIR=self.directory, PROFILING_INTERVAL_MS=0.5)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_triggers(self):
+        response = self.client.get(reverse('index'))
+        self.assertFalse(response.has_header('X-Profile-File'))
+        response = self.client.get(reverse('index'),
+                                   HTTP_X_PROFILE='подделка')
+        self.assertFalse(response.has_header('X-Profile-File'))
+        # Параметр работает только для сотрудников
+        self.client.force_login(User.objects.create(username='regular'))
+        response = self.client.get(reverse('index'), {'_profile': 1})
+        self.assertFalse(response.has_header('X-Profile-File'))
+        self.client.force_login(User.objects.create(username='staff',
+                                                    is_staff=True))
+        response = self.client.get(reverse('index'), {'_profile': 1})
+        self.assertIn('-index-', response['X-Profile-File'])
+
+    def test_signed_header_and_aggregate(self):
+        """
+        Профиль по токену пишется в каталог, команда сводит стеки
+        """
+        response = self.client.get(reverse('index'),
+                                   HTTP_X_PROFILE=profiling.make_token())
+        name = response['X-Profile-File']
+        self.assertTrue(name.endswith('.collapsed'))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, name)))
+        with override_settings(PROFILING_MODE='cprofile'):
+            response = self.client.get(reverse('index'),
+                                       HTTP_X_PROFILE=profiling.make_token())
+        self.assertTrue(response['X-Profile-File'].endswith('.prof'))
+        with open(os.path.join(self.directory, 'x-index-1.collapsed'),
+                  'w') as extra:
+            extra.write('a (m.py:1);b (m.py:2) 3\n')
+        out = io.StringIO()
+        with override_settings(PROFILING_INTERVAL_MS=5):
+            call_command('aggregate_profiles', view='index', stdout=out,
+                         stderr=io.StringIO())
+        lines = out.getvalue().splitlines()
+        # 3 сэмпла по 5 мс — в тех же микросекундах, что и pstats
+        self.assertIn('a (m.py:1);b (m.py:2) 15000', lines)
+        self.assertTrue(any('posts/views.py' in line and 'index' in line
+                            for line in lines))
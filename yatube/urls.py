@@ -28,6 +28,7 @@ urlpatterns = [
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
     path('admin/', admin.site.urls),
+    path("api/", include("posts.api_urls")),
     path('about/', include('django.contrib.flatpages.urls')),
     path("", include("posts.urls")),
 ]